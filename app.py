@@ -1,35 +1,140 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Blueprint, current_app, request
+from flask_compress import Compress
+from pydantic import ValidationError
+import orjson
+import bisect
+import functools
 import logging
+import threading
 from datetime import datetime, timedelta
-import numpy as np
 from database.mongodb_client import MongoDBClient
 from ml_models.risk_predictor import RiskPredictor
-from ml_models.anomaly_detector import AnomalyDetector
+from ml_models.anomaly_detector import AnomalyDetector, to_location_array
 from ml_models.pattern_analyzer import PatternAnalyzer
+from ml_models.threat_assessor import ThreatAssessor
+from schemas import RouteRequest, RouteBatchRequest, AnomalyRequest, PatternRequest, ThreatRequest, BatchRequest
 import config
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+api = Blueprint('api', __name__)
 
-# Initialize services
-db_client = MongoDBClient()
-risk_predictor = RiskPredictor(db_client)
-anomaly_detector = AnomalyDetector(db_client)
-pattern_analyzer = PatternAnalyzer(db_client)
+# Route risk score thresholds -> level and recommendations
+_RISK_THRESHOLDS = (25, 50, 75)
+_RISK_LEVELS = ('low', 'moderate', 'high', 'critical')
+_RISK_RECOMMENDATIONS = (
+    ['Maintain normal safety awareness', 'Keep emergency contacts updated'],
+    ['Stay alert', 'Share your location with trusted contacts', 'Avoid isolated areas'],
+    ['Consider alternative routes', 'Travel in groups if possible', 'Inform others of your plans'],
+    ['Strongly consider avoiding this route', 'Use alternative transportation', 'Contact local authorities if necessary']
+)
 
-@app.route('/health', methods=['GET'])
+# Per-endpoint concurrency limits (per worker process). Requests beyond the limit
+# are shed with a 503 instead of queueing up and exhausting memory
+_CONCURRENCY_LIMITS = {
+    'risk': threading.BoundedSemaphore(config.MAX_CONCURRENT_RISK),
+    'anomaly': threading.BoundedSemaphore(config.MAX_CONCURRENT_ANOMALY),
+    'patterns': threading.BoundedSemaphore(config.MAX_CONCURRENT_PATTERNS),
+    'threat': threading.BoundedSemaphore(config.MAX_CONCURRENT_THREAT)
+}
+
+def create_app():
+    """
+    Application factory
+    Each gunicorn worker imports this module after forking, so every worker
+    builds its own MongoDB client and ML services (pymongo is not fork-safe)
+    """
+    app = Flask(__name__)
+    
+    # Compress JSON responses (pattern analysis payloads shrink 5-10x)
+    app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+    app.config['COMPRESS_MIMETYPES'] = ['application/json']
+    app.config['COMPRESS_LEVEL'] = config.COMPRESS_LEVEL
+    app.config['COMPRESS_BR_LEVEL'] = config.COMPRESS_LEVEL
+    app.config['COMPRESS_MIN_SIZE'] = config.COMPRESS_MIN_SIZE
+    Compress(app)
+    
+    # Initialize services
+    db_client = MongoDBClient()
+    threat_assessor = ThreatAssessor()
+    if config.THREAT_RULES_FILE:
+        threat_assessor.load_rules_file(config.THREAT_RULES_FILE)
+    
+    app.extensions['suraksha'] = {
+        'db_client': db_client,
+        'risk_predictor': RiskPredictor(db_client),
+        'anomaly_detector': AnomalyDetector(db_client),
+        'pattern_analyzer': PatternAnalyzer(db_client),
+        'threat_assessor': threat_assessor
+    }
+    
+    app.register_blueprint(api)
+    return app
+
+def _validation_details(error):
+    """Fields that failed payload validation"""
+    return [
+        {'field': '.'.join(str(part) for part in err['loc']), 'message': err['msg']}
+        for err in error.errors()
+    ]
+
+def _validation_error(message, error):
+    """400 response listing the fields that failed payload validation"""
+    return _json({'error': message, 'details': _validation_details(error)}, 400)
+
+def _json(payload, status=200):
+    """
+    Serialize a response with orjson (handles datetimes and numpy values natively)
+    Non-string keys (e.g. hourly distributions) are stringified like json.dumps does
+    """
+    return current_app.response_class(
+        orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS),
+        status=status,
+        mimetype='application/json'
+    )
+
+def _ok(payload):
+    """
+    200 response stamped with the current time
+    The clock is read once per response and orjson formats the datetime itself
+    """
+    payload['timestamp'] = datetime.utcnow()
+    return _json(payload)
+
+def _service(name):
+    """Get a service initialized by create_app for the current app"""
+    return current_app.extensions['suraksha'][name]
+
+def _limited(name):
+    """Reject requests with 503 while the endpoint is at its concurrency limit"""
+    semaphore = _CONCURRENCY_LIMITS[name]
+    
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not semaphore.acquire(blocking=False):
+                response = _json({'error': 'Service busy, retry shortly'}, 503)
+                response.headers['Retry-After'] = '1'
+                return response
+            try:
+                return view(*args, **kwargs)
+            finally:
+                semaphore.release()
+        return wrapper
+    return decorator
+
+@api.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({
+    return _ok({
         'status': 'healthy',
-        'timestamp': datetime.utcnow().isoformat(),
         'service': 'ai-ml-engine'
     })
 
-@app.route('/api/risk/predict', methods=['POST'])
+@api.route('/api/risk/predict', methods=['POST'])
+@_limited('risk')
 def predict_route_risk():
     """
     Predict route safety score based on historical data
@@ -44,38 +149,65 @@ def predict_route_risk():
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'route' not in data:
-            return jsonify({'error': 'Route data is required'}), 400
-        
-        route = data['route']
-        time_of_day = data.get('time_of_day', 'day')
-        user_id = data.get('user_id')
-        
-        # Validate route data
-        if not all(key in route for key in ['start', 'end']):
-            return jsonify({'error': 'Start and end coordinates are required'}), 400
-        
-        # Predict risk score
-        risk_score = risk_predictor.predict_route_risk(
-            route=route,
-            time_of_day=time_of_day,
-            user_id=user_id
+        req = RouteRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error('Route with start and end coordinates is required', e)
+    
+    try:
+        return _ok(_route_risk(req))
+    except Exception as e:
+        logger.error(f"Error in route risk prediction: {str(e)}")
+        return _json({'error': 'Internal server error'}, 500)
+
+@api.route('/api/risk/predict/batch', methods=['POST'])
+@_limited('risk')
+def predict_route_risk_batch():
+    """
+    Predict safety scores for several routes in one request
+    Expected payload: {
+        "routes": [
+            {
+                "start": {"lat": float, "lng": float},
+                "end": {"lat": float, "lng": float},
+                "waypoints": [{"lat": float, "lng": float}] (optional)
+            }
+        ],
+        "time_of_day": "morning|afternoon|evening|night" (optional),
+        "user_id": string (optional)
+    }
+    """
+    try:
+        req = RouteBatchRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error(
+            f'Between 1 and {config.MAX_BATCH_ROUTES} routes with start and end coordinates are required', e
+        )
+    
+    try:
+        # Predict risk scores, sharing lookups for common points
+        risk_scores = _service('risk_predictor').predict_route_risk_batch(
+            routes=[route.model_dump() for route in req.routes],
+            time_of_day=req.time_of_day,
+            user_id=req.user_id
         )
         
-        return jsonify({
-            'risk_score': risk_score,
-            'risk_level': _get_risk_level(risk_score),
-            'recommendations': _get_risk_recommendations(risk_score),
-            'timestamp': datetime.utcnow().isoformat()
+        return _ok({
+            'predictions': [
+                {
+                    'risk_score': risk_score,
+                    'risk_level': _get_risk_level(risk_score),
+                    'recommendations': _get_risk_recommendations(risk_score)
+                }
+                for risk_score in risk_scores
+            ]
         })
         
     except Exception as e:
-        logger.error(f"Error in route risk prediction: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        logger.error(f"Error in batch route risk prediction: {str(e)}")
+        return _json({'error': 'Internal server error'}, 500)
 
-@app.route('/api/anomaly/detect', methods=['POST'])
+@api.route('/api/anomaly/detect', methods=['POST'])
+@_limited('anomaly')
 def detect_anomaly():
     """
     Detect unusual movement patterns
@@ -93,36 +225,18 @@ def detect_anomaly():
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'user_id' not in data or 'location_data' not in data:
-            return jsonify({'error': 'User ID and location data are required'}), 400
-        
-        user_id = data['user_id']
-        location_data = data['location_data']
-        
-        if not location_data or len(location_data) < 2:
-            return jsonify({'error': 'At least 2 location points are required'}), 400
-        
-        # Detect anomalies
-        anomaly_result = anomaly_detector.detect_anomalies(
-            user_id=user_id,
-            location_data=location_data
-        )
-        
-        return jsonify({
-            'is_anomaly': anomaly_result['is_anomaly'],
-            'confidence_score': anomaly_result['confidence'],
-            'anomaly_type': anomaly_result.get('type'),
-            'details': anomaly_result.get('details'),
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        
+        req = AnomalyRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error('User ID and at least 2 location points with ISO 8601 timestamps are required', e)
+    
+    try:
+        return _ok(_anomalies(req))
     except Exception as e:
         logger.error(f"Error in anomaly detection: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return _json({'error': 'Internal server error'}, 500)
 
-@app.route('/api/patterns/analyze', methods=['POST'])
+@api.route('/api/patterns/analyze', methods=['POST'])
+@_limited('patterns')
 def analyze_patterns():
     """
     Analyze incident patterns and identify hotspots
@@ -139,38 +253,18 @@ def analyze_patterns():
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'area' not in data:
-            return jsonify({'error': 'Area data is required'}), 400
-        
-        area = data['area']
-        time_range = data.get('time_range', {
-            'start': (datetime.utcnow() - timedelta(days=30)).isoformat(),
-            'end': datetime.utcnow().isoformat()
-        })
-        incident_types = data.get('incident_types')
-        
-        # Analyze patterns
-        pattern_result = pattern_analyzer.analyze_patterns(
-            area=area,
-            time_range=time_range,
-            incident_types=incident_types
-        )
-        
-        return jsonify({
-            'hotspots': pattern_result['hotspots'],
-            'trends': pattern_result['trends'],
-            'risk_zones': pattern_result['risk_zones'],
-            'insights': pattern_result['insights'],
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        
+        req = PatternRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error(f'Area with a radius of up to {config.MAX_PATTERN_RADIUS_KM:g} km is required', e)
+    
+    try:
+        return _ok(_patterns(req))
     except Exception as e:
         logger.error(f"Error in pattern analysis: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return _json({'error': 'Internal server error'}, 500)
 
-@app.route('/api/threat/assess', methods=['POST'])
+@api.route('/api/threat/assess', methods=['POST'])
+@_limited('threat')
 def assess_threat():
     """
     Assess threat level for a specific location and time
@@ -189,106 +283,154 @@ def assess_threat():
     }
     """
     try:
-        data = request.get_json()
-        
-        if not data or 'location' not in data:
-            return jsonify({'error': 'Location data is required'}), 400
-        
-        location = data['location']
-        user_profile = data.get('user_profile', {})
-        context = data.get('context', {})
-        
-        # Assess threat level
-        threat_assessment = _assess_threat_level(
-            location=location,
-            user_profile=user_profile,
-            context=context
-        )
-        
-        return jsonify({
-            'threat_level': threat_assessment['level'],
-            'threat_score': threat_assessment['score'],
-            'contributing_factors': threat_assessment['factors'],
-            'recommendations': threat_assessment['recommendations'],
-            'timestamp': datetime.utcnow().isoformat()
-        })
-        
+        req = ThreatRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error('Location data is required', e)
+    
+    try:
+        return _ok(_threat(req))
     except Exception as e:
         logger.error(f"Error in threat assessment: {str(e)}")
-        return jsonify({'error': 'Internal server error'}), 500
-
-def _get_risk_level(score):
-    """Convert numeric risk score to categorical level"""
-    if score < 25:
-        return 'low'
-    elif score < 50:
-        return 'moderate'
-    elif score < 75:
-        return 'high'
-    else:
-        return 'critical'
-
-def _get_risk_recommendations(score):
-    """Get safety recommendations based on risk score"""
-    if score < 25:
-        return ['Maintain normal safety awareness', 'Keep emergency contacts updated']
-    elif score < 50:
-        return ['Stay alert', 'Share your location with trusted contacts', 'Avoid isolated areas']
-    elif score < 75:
-        return ['Consider alternative routes', 'Travel in groups if possible', 'Inform others of your plans']
-    else:
-        return ['Strongly consider avoiding this route', 'Use alternative transportation', 'Contact local authorities if necessary']
+        return _json({'error': 'Internal server error'}, 500)
 
-def _assess_threat_level(location, user_profile, context):
+@api.route('/api/batch', methods=['POST'])
+def batch():
     """
-    Basic threat level assessment combining multiple factors
-    This is a simplified MVP implementation
+    Run several model requests in one round trip
+    Expected payload: {
+        "requests": [
+            {"type": "risk|anomaly|patterns|threat", "data": {...}}
+        ]
+    }
+    Each data object is the payload of the matching endpoint. Responses come back
+    in request order, each with its own status, so one bad item does not fail the rest
     """
-    base_score = 20  # Base threat score
-    factors = []
+    try:
+        req = BatchRequest.model_validate_json(request.get_data())
+    except ValidationError as e:
+        return _validation_error(
+            f'Between 1 and {config.MAX_BATCH_REQUESTS} requests with a type and data are required', e
+        )
+    
+    return _ok({'responses': [_run_batch_item(item) for item in req.requests]})
+
+def _run_batch_item(item):
+    """Validate and run one batch item under its endpoint's concurrency limit"""
+    model, handler = _BATCH_HANDLERS[item.type]
+    try:
+        req = model.model_validate(item.data)
+    except ValidationError as e:
+        return {'status': 400, 'error': 'Invalid request data', 'details': _validation_details(e)}
     
-    # Time-based risk factors
-    time_of_day = context.get('time_of_day', 'day')
-    if time_of_day in ['night', 'late_evening']:
-        base_score += 15
-        factors.append('Late hour increases risk')
-    elif time_of_day == 'evening':
-        base_score += 8
-        factors.append('Evening hours have moderate risk')
+    semaphore = _CONCURRENCY_LIMITS[item.type]
+    if not semaphore.acquire(blocking=False):
+        return {'status': 503, 'error': 'Service busy, retry shortly'}
+    try:
+        return {'status': 200, **handler(req)}
+    except Exception as e:
+        logger.error(f"Error in batch {item.type} request: {str(e)}")
+        return {'status': 500, 'error': 'Internal server error'}
+    finally:
+        semaphore.release()
+
+def _route_risk(req):
+    """Risk prediction payload for a validated RouteRequest"""
+    risk_score = _service('risk_predictor').predict_route_risk(
+        route=req.route.model_dump(),
+        time_of_day=req.time_of_day,
+        user_id=req.user_id
+    )
     
-    # Weather-based factors
-    weather = context.get('weather')
-    if weather in ['rainy', 'foggy']:
-        base_score += 10
-        factors.append('Poor weather conditions')
+    return {
+        'risk_score': risk_score,
+        'risk_level': _get_risk_level(risk_score),
+        'recommendations': _get_risk_recommendations(risk_score)
+    }
+
+def _anomalies(req):
+    """Anomaly detection payload for a validated AnomalyRequest"""
+    # Convert to arrays once here; the detectors work on the columns
+    location_data = to_location_array([point.model_dump() for point in req.location_data])
     
-    # Get historical incident data for the location
-    # This would integrate with the pattern analyzer
+    anomaly_result = _service('anomaly_detector').detect_anomalies(
+        user_id=req.user_id,
+        location_data=location_data
+    )
     
-    # Determine level
-    if base_score < 30:
-        level = 'low'
-        recommendations = ['Normal safety precautions']
-    elif base_score < 50:
-        level = 'moderate'
-        recommendations = ['Increased awareness recommended', 'Share location with contacts']
-    elif base_score < 70:
-        level = 'high'
-        recommendations = ['Exercise caution', 'Consider alternative routes']
+    return {
+        'is_anomaly': anomaly_result['is_anomaly'],
+        'confidence_score': anomaly_result['confidence'],
+        'anomaly_type': anomaly_result.get('type'),
+        'details': anomaly_result.get('details')
+    }
+
+def _patterns(req):
+    """Pattern analysis payload for a validated PatternRequest (defaults to the last 30 days)"""
+    if req.time_range:
+        time_range = req.time_range.model_dump()
     else:
-        level = 'critical'
-        recommendations = ['Avoid area if possible', 'Contact emergency services if in danger']
+        now = datetime.utcnow()
+        time_range = {
+            'start': (now - timedelta(days=30)).isoformat(),
+            'end': now.isoformat()
+        }
+    
+    pattern_result = _service('pattern_analyzer').analyze_patterns(
+        area=req.area.model_dump(),
+        time_range=time_range,
+        incident_types=req.incident_types
+    )
     
     return {
-        'level': level,
-        'score': min(100, base_score),
-        'factors': factors,
-        'recommendations': recommendations
+        'hotspots': pattern_result['hotspots'],
+        'trends': pattern_result['trends'],
+        'risk_zones': pattern_result['risk_zones'],
+        'insights': pattern_result['insights']
     }
 
+def _threat(req):
+    """Threat assessment payload for a validated ThreatRequest"""
+    threat_assessment = _service('threat_assessor').assess_threat_level(
+        location=req.location.model_dump(),
+        user_profile=req.user_profile,
+        context=req.context
+    )
+    
+    return {
+        'threat_level': threat_assessment['level'],
+        'threat_score': threat_assessment['score'],
+        'contributing_factors': threat_assessment['factors'],
+        'recommendations': threat_assessment['recommendations']
+    }
+
+# Batch item type -> (payload model, handler); types match the concurrency limit names
+_BATCH_HANDLERS = {
+    'risk': (RouteRequest, _route_risk),
+    'anomaly': (AnomalyRequest, _anomalies),
+    'patterns': (PatternRequest, _patterns),
+    'threat': (ThreatRequest, _threat)
+}
+
+def _get_risk_level(score):
+    """Convert numeric risk score to categorical level"""
+    return _RISK_LEVELS[bisect.bisect_right(_RISK_THRESHOLDS, score)]
+
+def _get_risk_recommendations(score):
+    """Get safety recommendations based on risk score"""
+    return list(_RISK_RECOMMENDATIONS[bisect.bisect_right(_RISK_THRESHOLDS, score)])
+
+app = create_app()
+
 if __name__ == '__main__':
+    # Development server only - production runs under gunicorn:
+    #   gunicorn -c gunicorn.conf.py app:app
+    # The reloader is off unless USE_RELOADER=true: it runs the app in a second
+    # process, building the models and MongoDB client twice. Threads rather than
+    # processes=N, since forked request handlers exit without flushing buffered writes
     app.run(
         host=config.AI_HOST,
         port=config.AI_PORT,
-        debug=config.DEBUG
+        debug=config.DEBUG,
+        use_reloader=config.USE_RELOADER,
+        threaded=True
     )
\ No newline at end of file
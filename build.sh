@@ -12,4 +12,8 @@ pip install --upgrade pip==23.1.2 setuptools==67.8.0 wheel==0.40.0
 # Install dependencies
 pip install -r requirements.txt
 
+# Compile the numba kernels now; they are cached on disk (ml_models/__pycache__),
+# so gunicorn workers load them at import instead of JIT-compiling on cold start
+python -c "import ml_models.numeric"
+
 echo "Build completed successfully!"
\ No newline at end of file
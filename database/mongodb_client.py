@@ -1,44 +1,160 @@
 from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure
+from pymongo.errors import ConnectionFailure, OperationFailure
+from bson import ObjectId
+from cachetools import TTLCache
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from scipy.spatial import cKDTree
+import atexit
 import logging
+import threading
+import numpy as np
 import config
+from distance.haversine import EARTH_RADIUS_KM, km_to_chord, to_unit_xyz
 from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+# Indexes backing the geo/time queries below (collection -> index keys)
+INDEXES = {
+    'incidents': [('location', '2dsphere'), ('createdAt', -1)],
+    'panicalerts': [('location', '2dsphere'), ('timestamp', -1)],
+    'userlocations': [('userId', 1), ('timestamp', 1)]
+}
+
+# Default projections - only the fields the ML models read
+INCIDENT_PROJECTION = {'_id': 1, 'location': 1, 'type': 1, 'severity': 1, 'createdAt': 1}
+PANIC_ALERT_PROJECTION = {'_id': 1, 'location': 1, 'timestamp': 1}
+USER_LOCATION_PROJECTION = {'_id': 0, 'location': 1, 'timestamp': 1, 'speed': 1}
+
 class MongoDBClient:
-    def __init__(self):
+    # One MongoClient (and connection pool) per process, shared by all instances
+    _client = None
+    _connected = False
+    _indexed = set()  # Collections whose INDEXES entry was created successfully
+    
+    # Shared thread pool for overlapping independent reads within a request
+    _read_pool = None
+    _read_pool_lock = threading.Lock()
+    
+    def __init__(self, **client_options):
         self.client = None
         self.db = None
-        self.connect()
+        
+        # Buffered writes, flushed in bulk by a background thread
+        self._write_buffers = {
+            'risk_predictions': deque(),
+            'anomaly_detections': deque()
+        }
+        self.dropped_writes = {collection: 0 for collection in self._write_buffers}
+        self._flush_event = threading.Event()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        
+        # Short-lived cache for repeated geospatial reads
+        self._query_cache = TTLCache(maxsize=config.QUERY_CACHE_SIZE, ttl=config.QUERY_CACHE_TTL)
+        self._cache_lock = threading.Lock()
+        
+        self.connect(**client_options)
+    
+    def connect(self, **client_options):
+        """
+        Set up the shared MongoDB client (the connection itself is opened lazily)
+        client_options override the configured MongoClient pool settings; they only
+        apply to the first instance in the process, later ones share its client
+        """
+        if MongoDBClient._client is None:
+            options = {
+                'maxPoolSize': config.MONGODB_MAX_POOL_SIZE,
+                'minPoolSize': config.MONGODB_MIN_POOL_SIZE,
+                'maxIdleTimeMS': config.MONGODB_MAX_IDLE_TIME_MS,
+                'socketTimeoutMS': config.MONGODB_SOCKET_TIMEOUT_MS,
+                'serverSelectionTimeoutMS': config.MONGODB_SERVER_SELECTION_TIMEOUT_MS
+            }
+            options.update(client_options)
+            MongoDBClient._client = MongoClient(config.MONGODB_URL, connect=False, **options)
+        self.client = MongoDBClient._client
+        self.db = self.client[config.MONGODB_DATABASE]
     
-    def connect(self):
-        """Connect to MongoDB"""
+    def ensure_connected(self):
+        """Ping MongoDB once before the first query"""
+        if MongoDBClient._connected:
+            return
         try:
-            self.client = MongoClient(config.MONGODB_URL)
-            self.db = self.client[config.MONGODB_DATABASE]
-            # Test connection
             self.client.admin.command('ping')
+            MongoDBClient._connected = True
             logger.info("Successfully connected to MongoDB")
         except ConnectionFailure as e:
             logger.error(f"Failed to connect to MongoDB: {str(e)}")
             raise
+        
+        self._ensure_indexes()
     
-    def get_incidents_in_area(self, center_lat, center_lng, radius_km, start_date=None, end_date=None, incident_types=None):
+    def _ensure_indexes(self):
+        """Create the indexes used by the geospatial and history queries"""
+        for collection, keys in INDEXES.items():
+            try:
+                self.db[collection].create_index(keys)
+                MongoDBClient._indexed.add(collection)
+            except OperationFailure as e:
+                logger.warning(f"Could not create index on {collection}: {str(e)}")
+    
+    def _within_radius(self, center_lat, center_lng, radius_km):
+        """Build a 2dsphere-indexable filter for points within radius_km of a center"""
+        return {
+            '$geoWithin': {
+                '$centerSphere': [
+                    [center_lng, center_lat],
+                    radius_km / EARTH_RADIUS_KM  # Convert km to radians (same sphere as the haversine helpers)
+                ]
+            }
+        }
+    
+    def _cache_key(self, collection, points, radius_km, start_date=None, end_date=None, incident_types=None,
+                   projection=None):
+        """
+        Build a cache key from rounded coordinates and TTL-sized date buckets
+        so that near-identical queries share an entry
+        """
+        def bucket(date):
+            return int(date.timestamp() // config.QUERY_CACHE_TTL) if date else None
+        
+        return (
+            collection,
+            tuple((round(lat, 3), round(lng, 3)) for lat, lng in points),
+            round(radius_km, 2),
+            bucket(start_date),
+            bucket(end_date),
+            frozenset(incident_types or ()),
+            tuple(sorted(projection.items())) if projection else None
+        )
+    
+    def _cache_get(self, key):
+        with self._cache_lock:
+            return self._query_cache.get(key)
+    
+    def _cache_put(self, key, documents):
+        with self._cache_lock:
+            self._query_cache[key] = documents
+    
+    def get_incidents_in_area(self, center_lat, center_lng, radius_km, start_date=None, end_date=None, incident_types=None,
+                              projection=INCIDENT_PROJECTION):
         """
         Get incidents within a specified area and time range
+        Results may be served from the query cache and must not be mutated
         """
         try:
+            cache_key = self._cache_key('incidents', [(center_lat, center_lng)], radius_km,
+                                        start_date, end_date, incident_types, projection)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            self.ensure_connected()
+            
             # Build query
             query = {
-                'location': {
-                    '$geoWithin': {
-                        '$centerSphere': [
-                            [center_lng, center_lat],
-                            radius_km / 6371  # Convert km to radians
-                        ]
-                    }
-                }
+                'location': self._within_radius(center_lat, center_lng, radius_km)
             }
             
             # Add date range filter
@@ -55,18 +171,104 @@ class MongoDBClient:
                 query['type'] = {'$in': incident_types}
             
             # Execute query - using 'incidents' collection (lowercase, pluralized by Mongoose)
-            incidents = list(self.db.incidents.find(query))
+            incidents = list(self.db.incidents.find(query, projection))
+            self._cache_put(cache_key, incidents)
             return incidents
             
         except Exception as e:
             logger.error(f"Error fetching incidents: {str(e)}")
             return []
     
-    def get_user_location_history(self, user_id, hours_back=24):
+    def get_recent_incidents(self, start_date, limit=None, projection=INCIDENT_PROJECTION):
+        """
+        Get every incident created since start_date (for building in-memory indexes)
+        Returns None if the query failed, so callers can tell an outage from no data
+        """
+        try:
+            self.ensure_connected()
+            cursor = self.db.incidents.find({'createdAt': {'$gte': start_date}}, projection).batch_size(5000)
+            if limit:
+                cursor = cursor.limit(limit)
+            return list(cursor)
+            
+        except Exception as e:
+            logger.error(f"Error fetching recent incidents: {str(e)}")
+            return None
+    
+    def get_incidents_in_areas(self, points, radius_km, start_date=None, end_date=None,
+                               projection=INCIDENT_PROJECTION):
+        """
+        get_incidents_in_area for several (lat, lng) centers in one $or query
+        Returns one list per center (cached like a single-area query), or None if the query failed
+        """
+        return self._find_in_areas('incidents', 'createdAt', points, radius_km, start_date, end_date, projection)
+    
+    def get_panic_alerts_in_areas(self, points, radius_km, start_date=None, end_date=None,
+                                  projection=PANIC_ALERT_PROJECTION):
+        """
+        get_panic_alerts_in_area for several (lat, lng) centers in one $or query
+        Returns one list per center (cached like a single-area query), or None if the query failed
+        """
+        return self._find_in_areas('panicalerts', 'timestamp', points, radius_km, start_date, end_date, projection)
+    
+    def _find_in_areas(self, collection, date_field, points, radius_km, start_date, end_date, projection):
+        """
+        Fetch the documents near any uncached center with a single query, then
+        split them back out per center (a document may belong to several)
+        """
+        try:
+            keys = [self._cache_key(collection, [point], radius_km, start_date, end_date, projection=projection)
+                    for point in points]
+            results = [self._cache_get(key) for key in keys]
+            missing = [i for i, result in enumerate(results) if result is None]
+            if not missing:
+                return results
+            
+            self.ensure_connected()
+            query = {
+                '$or': [{'location': self._within_radius(points[i][0], points[i][1], radius_km)} for i in missing]
+            }
+            
+            if start_date or end_date:
+                date_filter = {}
+                if start_date:
+                    date_filter['$gte'] = start_date
+                if end_date:
+                    date_filter['$lte'] = end_date
+                query[date_field] = date_filter
+            
+            documents = list(self.db[collection].find(query, projection))
+            for i, area_documents in zip(missing, self._split_by_area(documents, [points[i] for i in missing], radius_km)):
+                results[i] = area_documents
+                self._cache_put(keys[i], area_documents)
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error fetching {collection} for {len(points)} areas: {str(e)}")
+            return None
+    
+    def _split_by_area(self, documents, points, radius_km):
+        """Assign documents to every center whose $centerSphere radius contains them"""
+        coordinates = [document.get('location', {}).get('coordinates') or () for document in documents]
+        valid = [i for i, coords in enumerate(coordinates) if len(coords) == 2]
+        if not valid:
+            return [[] for _ in points]
+        
+        lngs, lats = np.array([coordinates[i] for i in valid], dtype=np.float64).T
+        tree = cKDTree(to_unit_xyz(lats, lngs))
+        centers = to_unit_xyz(*np.array(points, dtype=np.float64).T)
+        chord = km_to_chord(radius_km)  # Same sphere as $centerSphere
+        return [
+            [documents[valid[j]] for j in idxs]
+            for idxs in tree.query_ball_point(centers, chord, return_sorted=True)
+        ]
+    
+    def get_user_location_history(self, user_id, hours_back=24, projection=USER_LOCATION_PROJECTION):
         """
         Get user's recent location history
         """
         try:
+            self.ensure_connected()
             start_time = datetime.utcnow() - timedelta(hours=hours_back)
             
             query = {
@@ -75,27 +277,33 @@ class MongoDBClient:
             }
             
             # Using 'userlocations' collection (lowercase, pluralized by Mongoose)
-            locations = list(self.db.userlocations.find(query).sort('timestamp', 1))
+            cursor = self.db.userlocations.find(query, projection).sort('timestamp', 1).batch_size(500)
+            if 'userlocations' in MongoDBClient._indexed:
+                # Filter and sort both resolve on the (userId, timestamp) index
+                cursor = cursor.hint(INDEXES['userlocations'])
+            locations = list(cursor)
             return locations
             
         except Exception as e:
             logger.error(f"Error fetching user location history: {str(e)}")
             return []
     
-    def get_panic_alerts_in_area(self, center_lat, center_lng, radius_km, start_date=None, end_date=None):
+    def get_panic_alerts_in_area(self, center_lat, center_lng, radius_km, start_date=None, end_date=None,
+                                 projection=PANIC_ALERT_PROJECTION):
         """
         Get panic alerts within a specified area and time range
+        Results may be served from the query cache and must not be mutated
         """
         try:
+            cache_key = self._cache_key('panicalerts', [(center_lat, center_lng)], radius_km,
+                                        start_date, end_date, projection=projection)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            self.ensure_connected()
             query = {
-                'location': {
-                    '$geoWithin': {
-                        '$centerSphere': [
-                            [center_lng, center_lat],
-                            radius_km / 6371
-                        ]
-                    }
-                }
+                'location': self._within_radius(center_lat, center_lng, radius_km)
             }
             
             if start_date or end_date:
@@ -107,36 +315,54 @@ class MongoDBClient:
                 query['timestamp'] = date_filter
             
             # Using 'panicalerts' collection (lowercase, pluralized by Mongoose)
-            alerts = list(self.db.panicalerts.find(query))
+            alerts = list(self.db.panicalerts.find(query, projection))
+            self._cache_put(cache_key, alerts)
             return alerts
             
         except Exception as e:
             logger.error(f"Error fetching panic alerts: {str(e)}")
             return []
     
-    def get_historical_route_data(self, start_lat, start_lng, end_lat, end_lng, radius_km=1.0):
+    def get_historical_route_data(self, start_lat, start_lng, end_lat, end_lng, radius_km=1.0,
+                                  start_date=None, end_date=None, incident_types=None,
+                                  projection=INCIDENT_PROJECTION):
         """
         Get historical incident data along a route
+        Results may be served from the query cache and must not be mutated
         """
         try:
+            cache_key = self._cache_key('incidents', [(start_lat, start_lng), (end_lat, end_lng)], radius_km,
+                                        start_date, end_date, incident_types, projection)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
+            
+            self.ensure_connected()
+            
             # For MVP, we'll check incidents near start and end points
             # In production, this would analyze the entire route corridor
+            # A single $or query lets MongoDB return each incident once
+            query = {
+                '$or': [
+                    {'location': self._within_radius(start_lat, start_lng, radius_km)},
+                    {'location': self._within_radius(end_lat, end_lng, radius_km)}
+                ]
+            }
             
-            start_incidents = self.get_incidents_in_area(start_lat, start_lng, radius_km)
-            end_incidents = self.get_incidents_in_area(end_lat, end_lng, radius_km)
-            
-            # Combine and deduplicate
-            all_incidents = start_incidents + end_incidents
-            unique_incidents = []
-            seen_ids = set()
+            if start_date or end_date:
+                date_filter = {}
+                if start_date:
+                    date_filter['$gte'] = start_date
+                if end_date:
+                    date_filter['$lte'] = end_date
+                query['createdAt'] = date_filter
             
-            for incident in all_incidents:
-                incident_id = str(incident.get('_id'))
-                if incident_id not in seen_ids:
-                    unique_incidents.append(incident)
-                    seen_ids.add(incident_id)
+            if incident_types:
+                query['type'] = {'$in': incident_types}
             
-            return unique_incidents
+            incidents = list(self.db.incidents.find(query, projection))
+            self._cache_put(cache_key, incidents)
+            return incidents
             
         except Exception as e:
             logger.error(f"Error fetching route data: {str(e)}")
@@ -145,11 +371,11 @@ class MongoDBClient:
     def store_risk_prediction(self, prediction_data):
         """
         Store risk prediction for future analysis
+        The write is buffered; the returned id is assigned before insertion
         """
         try:
             prediction_data['timestamp'] = datetime.utcnow()
-            result = self.db.risk_predictions.insert_one(prediction_data)
-            return str(result.inserted_id)
+            return self._enqueue_write('risk_predictions', prediction_data)
         except Exception as e:
             logger.error(f"Error storing risk prediction: {str(e)}")
             return None
@@ -157,17 +383,95 @@ class MongoDBClient:
     def store_anomaly_detection(self, anomaly_data):
         """
         Store anomaly detection result
+        The write is buffered; the returned id is assigned before insertion
         """
         try:
             anomaly_data['timestamp'] = datetime.utcnow()
-            result = self.db.anomaly_detections.insert_one(anomaly_data)
-            return str(result.inserted_id)
+            return self._enqueue_write('anomaly_detections', anomaly_data)
         except Exception as e:
             logger.error(f"Error storing anomaly detection: {str(e)}")
             return None
     
+    def _enqueue_write(self, collection, document):
+        """
+        Buffer a document for the background bulk writer and return its id
+        When the buffer is full (MongoDB slow or down) the document is dropped
+        and counted in dropped_writes instead of growing memory without bound
+        """
+        buffer = self._write_buffers[collection]
+        if len(buffer) >= config.MONGODB_WRITE_BUFFER_SIZE:
+            self.dropped_writes[collection] += 1
+            if self.dropped_writes[collection] % 1000 == 1:
+                logger.warning(f"Write buffer for {collection} is full, "
+                               f"{self.dropped_writes[collection]} documents dropped so far")
+            self._flush_event.set()
+            return None
+        
+        document.setdefault('_id', ObjectId())
+        buffer.append(document)
+        
+        self._start_writer()
+        if len(buffer) >= config.MONGODB_WRITE_BATCH_SIZE:
+            self._flush_event.set()
+        
+        return str(document['_id'])
+    
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run a query on the shared read pool and return its Future
+        pymongo releases the GIL while waiting on the socket, so reads submitted
+        together overlap their round trips. The pool is created on first use
+        (after any worker fork) and reused for the life of the process
+        """
+        if MongoDBClient._read_pool is None:
+            with MongoDBClient._read_pool_lock:
+                if MongoDBClient._read_pool is None:
+                    MongoDBClient._read_pool = ThreadPoolExecutor(
+                        max_workers=config.MONGODB_READ_THREADS,
+                        thread_name_prefix='mongo-read'
+                    )
+        return MongoDBClient._read_pool.submit(fn, *args, **kwargs)
+    
+    def _start_writer(self):
+        """Start the background writer on first use (after any worker fork)"""
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name='mongo-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush_writes)
+    
+    def _writer_loop(self):
+        """Flush buffered writes when a batch fills up or the flush interval passes"""
+        while True:
+            self._flush_event.wait(config.MONGODB_WRITE_FLUSH_INTERVAL)
+            self._flush_event.clear()
+            self.flush_writes()
+    
+    def flush_writes(self):
+        """Write all buffered documents with unordered insert_many batches"""
+        for collection, buffer in self._write_buffers.items():
+            while buffer:
+                batch = []
+                while buffer and len(batch) < config.MONGODB_WRITE_BATCH_SIZE:
+                    batch.append(buffer.popleft())
+                
+                try:
+                    self.ensure_connected()
+                    self.db[collection].insert_many(batch, ordered=False)
+                except Exception as e:
+                    logger.error(f"Error writing {len(batch)} documents to {collection}: {str(e)}")
+    
     def close(self):
         """Close MongoDB connection"""
+        self.flush_writes()
+        if MongoDBClient._read_pool is not None:
+            MongoDBClient._read_pool.shutdown(wait=False)
+            MongoDBClient._read_pool = None
         if self.client:
             self.client.close()
+            MongoDBClient._client = None
+            MongoDBClient._connected = False
+            MongoDBClient._indexed.clear()
             logger.info("MongoDB connection closed")
\ No newline at end of file
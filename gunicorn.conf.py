@@ -0,0 +1,26 @@
+import os
+# Import names, not the module: gunicorn reads every module-level name here as a
+# setting, and `config` is one of them
+from config import AI_HOST, AI_PORT, DEBUG
+
+# Gunicorn configuration for the AI service
+# Start with: gunicorn -c gunicorn.conf.py app:app
+
+bind = f"{AI_HOST}:{AI_PORT}"
+
+# Worker pool - each worker imports app.py after forking, so every worker
+# opens its own MongoDB client (do not enable preload_app)
+workers = int(os.getenv('GUNICORN_WORKERS', 2 * (os.cpu_count() or 1) + 1))
+
+# gthread overlaps MongoDB I/O across requests (pymongo releases the GIL while
+# waiting on sockets). For mostly I/O-bound traffic set GUNICORN_WORKER_CLASS=gevent
+# (requires `pip install gevent`); gunicorn then monkey-patches pymongo so each
+# worker can keep many in-flight queries
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 100))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 60))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = 'debug' if DEBUG else 'info'
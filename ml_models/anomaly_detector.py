@@ -1,20 +1,102 @@
+import math
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import logging
-from geopy.distance import geodesic
+import threading
+from types import MappingProxyType
+from cachetools import TTLCache
+from scipy.spatial import cKDTree
+from distance.haversine import METERS_PER_DEGREE, equirect_m, hav_vec_rad, to_unit_xyz, chord_to_km
+from ml_models.numeric import consecutive_motion, track_features
 import config
-from scipy import stats
 
 logger = logging.getLogger(__name__)
 
+# Histories shorter than this are clustered point by point rather than on a grid
+GRID_MIN_POINTS = 64
+
+# Typical-location sets smaller than this are scanned directly instead of
+# through a KD-tree (a brute-force broadcast is cheaper for a few centers)
+LOCATION_TREE_MIN_SIZE = 32
+
+# Default movement profile for new users. Shared by every caller, so it is
+# read-only; copy it with dict() before modifying
+_DEFAULT_PROFILE = MappingProxyType({
+    'avg_speed': 25.0,  # km/h
+    'max_speed': 60.0,
+    'speed_std': 15.0,
+    'avg_distance': 500.0,  # meters
+    'avg_time_interval': 300.0,  # seconds
+    'typical_locations': (),
+    'speed_percentiles': MappingProxyType({
+        '95': 80.0,
+        '99': 120.0
+    })
+})
+
+# Highest confidence any detector reports; a result at this level ends detection
+EARLY_EXIT_CONFIDENCE = 0.9
+
+# Structure-of-arrays layout for incoming location fixes: ts is epoch seconds,
+# hour is the wall-clock hour of the original timestamp, missing spd/acc are NaN
+LOCATION_DTYPE = np.dtype([
+    ('lat', 'f8'), ('lng', 'f8'), ('ts', 'f8'), ('hour', 'u1'), ('spd', 'f8'), ('acc', 'f8')
+])
+
+def _parse_timestamps(timestamps):
+    """
+    Parse ISO timestamps into epoch seconds and wall-clock hours
+    UTC ('Z') and naive timestamps are parsed in bulk as datetime64; anything
+    with an explicit offset falls back to datetime.fromisoformat per point
+    """
+    if not any('+' in stamp[19:] or '-' in stamp[19:] for stamp in timestamps):
+        try:
+            parsed = np.array([stamp[:-1] if stamp.endswith('Z') else stamp for stamp in timestamps], dtype='datetime64[us]')
+            times_sec = parsed.astype(np.int64) / 1e6
+            hours = parsed.astype('datetime64[h]').astype(np.int64) % 24
+            return times_sec, hours
+        except ValueError:
+            pass
+    
+    # fromisoformat only accepts a 'Z' suffix from Python 3.11
+    parsed = [datetime.fromisoformat(stamp[:-1] + '+00:00' if stamp.endswith('Z') else stamp) for stamp in timestamps]
+    times_sec = np.array([timestamp.timestamp() for timestamp in parsed], dtype=np.float64)
+    hours = np.array([timestamp.hour for timestamp in parsed], dtype=np.int64)
+    return times_sec, hours
+
+def to_location_array(location_data):
+    """
+    Convert a list of location dicts into a LOCATION_DTYPE structured array
+    Timestamps are parsed once here so the detectors only see numbers
+    """
+    def _row(point):
+        speed = point.get('speed')
+        accuracy = point.get('accuracy')
+        return (
+            point['lat'],
+            point['lng'],
+            0.0,
+            0,
+            np.nan if speed is None else speed,
+            np.nan if accuracy is None else accuracy
+        )
+    
+    location_array = np.fromiter(map(_row, location_data), dtype=LOCATION_DTYPE, count=len(location_data))
+    location_array['ts'], location_array['hour'] = _parse_timestamps([point['timestamp'] for point in location_data])
+    return location_array
+
 class AnomalyDetector:
     def __init__(self, db_client):
         self.db_client = db_client
-        self.user_profiles = {}  # Cache for user movement profiles
+        # Bounded LRU cache for user movement profiles; entries expire so
+        # profiles are rebuilt from fresh history
+        self.user_profiles = TTLCache(maxsize=config.PROFILE_CACHE_SIZE, ttl=config.PROFILE_CACHE_TTL)
+        self._profiles_lock = threading.Lock()
     
     def detect_anomalies(self, user_id, location_data):
         """
         Detect anomalies in user movement patterns
+        location_data is a LOCATION_DTYPE array (see to_location_array)
         Returns anomaly information with confidence score
         """
         try:
@@ -32,14 +114,21 @@ class AnomalyDetector:
             # Get user's historical movement profile
             user_profile = self._get_user_movement_profile(user_id)
             
-            # Run multiple anomaly detection algorithms
-            speed_anomaly = self._detect_speed_anomaly(processed_data, user_profile)
-            pattern_anomaly = self._detect_pattern_anomaly(processed_data, user_profile)
-            location_anomaly = self._detect_location_anomaly(processed_data, user_profile)
-            time_anomaly = self._detect_time_anomaly(processed_data, user_profile)
+            # Run multiple anomaly detection algorithms, stopping at the first
+            # result no later detector can outrank
+            anomalies = []
+            detectors = (
+                self._detect_speed_anomaly,
+                self._detect_pattern_anomaly,
+                self._detect_location_anomaly,
+                self._detect_time_anomaly
+            )
+            for detector in detectors:
+                anomalies.append(detector(processed_data, user_profile))
+                if anomalies[-1]['confidence'] >= EARLY_EXIT_CONFIDENCE:
+                    break
             
             # Combine results
-            anomalies = [speed_anomaly, pattern_anomaly, location_anomaly, time_anomaly]
             max_confidence_anomaly = max(anomalies, key=lambda x: x['confidence'])
             
             # Store result for future learning
@@ -59,46 +148,36 @@ class AnomalyDetector:
     def _process_location_data(self, location_data):
         """
         Process and enrich location data with derived features
+        Returns a dict of equal-length arrays (distances and time_diffs are
+        measured from the previous point, 0 for the first) plus the summary
+        features shared by the detectors
         """
-        processed = []
+        lats = location_data['lat']
+        lngs = location_data['lng']
+        times_sec = location_data['ts']
+        reported_speeds = np.nan_to_num(location_data['spd'], nan=0.0)
+        accuracies = np.nan_to_num(location_data['acc'], nan=10.0)
         
-        for i, point in enumerate(location_data):
-            processed_point = {
-                'lat': point['lat'],
-                'lng': point['lng'],
-                'timestamp': datetime.fromisoformat(point['timestamp'].replace('Z', '+00:00')),
-                'accuracy': point.get('accuracy', 10),
-                'speed': point.get('speed', 0)
-            }
-            
-            # Calculate derived features
-            if i > 0:
-                prev_point = processed[i-1]
-                
-                # Distance traveled
-                distance = geodesic(
-                    (prev_point['lat'], prev_point['lng']),
-                    (processed_point['lat'], processed_point['lng'])
-                ).meters
-                
-                # Time difference
-                time_diff = (processed_point['timestamp'] - prev_point['timestamp']).total_seconds()
-                
-                # Calculated speed (if not provided)
-                if processed_point['speed'] == 0 and time_diff > 0:
-                    calculated_speed = (distance / time_diff) * 3.6  # m/s to km/h
-                    processed_point['calculated_speed'] = calculated_speed
-                else:
-                    processed_point['calculated_speed'] = processed_point['speed']
-                
-                processed_point['distance_from_prev'] = distance
-                processed_point['time_from_prev'] = time_diff
-            else:
-                processed_point['calculated_speed'] = 0
-                processed_point['distance_from_prev'] = 0
-                processed_point['time_from_prev'] = 0
-            
-            processed.append(processed_point)
+        # Motion, speed statistics and bearing changes (moves > 10 m) in one pass
+        (distances, time_diffs, speeds, direction_changes,
+         speed_count, max_speed, max_speed_change) = track_features(lats, lngs, times_sec, reported_speeds, 10.0)
+        
+        # Structure of arrays: one contiguous column per feature
+        processed = {
+            'lats': lats,
+            'lngs': lngs,
+            'timestamps': times_sec,
+            'hours': location_data['hour'],
+            'accuracies': accuracies,
+            'reported_speeds': reported_speeds,
+            'speeds': speeds,
+            'distances': distances,
+            'time_diffs': time_diffs,
+            'direction_changes': direction_changes,
+            'speed_count': speed_count,
+            'max_speed': max_speed,
+            'max_speed_change': max_speed_change
+        }
         
         return processed
     
@@ -106,8 +185,10 @@ class AnomalyDetector:
         """
         Get or build user's historical movement profile
         """
-        if user_id in self.user_profiles:
-            return self.user_profiles[user_id]
+        with self._profiles_lock:
+            profile = self.user_profiles.get(user_id)
+        if profile is not None:
+            return profile
         
         try:
             # Get user's location history
@@ -115,139 +196,147 @@ class AnomalyDetector:
             
             if len(history) < 10:
                 # Not enough history, use default profile
-                profile = self._get_default_profile()
+                profile = _DEFAULT_PROFILE
             else:
                 profile = self._build_user_profile(history)
             
             # Cache the profile
-            self.user_profiles[user_id] = profile
+            with self._profiles_lock:
+                self.user_profiles[user_id] = profile
             
             return profile
             
         except Exception as e:
             logger.error(f"Error getting user profile: {str(e)}")
-            return self._get_default_profile()
+            return _DEFAULT_PROFILE
     
     def _build_user_profile(self, location_history):
         """
         Build movement profile from historical data
         """
-        speeds = []
-        distances = []
-        time_intervals = []
-        locations = []
+        # Columns of the history; fixes without coordinates become NaN
+        coords = np.array([
+            point['location'].get('coordinates', (np.nan, np.nan)) for point in location_history
+        ], dtype=np.float64).reshape(-1, 2)  # [lng, lat]
+        lats = np.ascontiguousarray(coords[:, 1])
+        lngs = np.ascontiguousarray(coords[:, 0])
+        times_sec = np.array([point['timestamp'].timestamp() for point in location_history], dtype=np.float64)
         
-        for i in range(1, len(location_history)):
-            curr = location_history[i]
-            prev = location_history[i-1]
-            
-            # Calculate movement metrics
-            if 'coordinates' in curr['location'] and 'coordinates' in prev['location']:
-                curr_coords = curr['location']['coordinates']  # [lng, lat]
-                prev_coords = prev['location']['coordinates']
-                
-                distance = geodesic(
-                    (prev_coords[1], prev_coords[0]),
-                    (curr_coords[1], curr_coords[0])
-                ).meters
-                
-                time_diff = (curr['timestamp'] - prev['timestamp']).total_seconds()
-                
-                if time_diff > 0:
-                    speed = (distance / time_diff) * 3.6  # km/h
-                    
-                    speeds.append(speed)
-                    distances.append(distance)
-                    time_intervals.append(time_diff)
-                    locations.append((curr_coords[1], curr_coords[0]))  # lat, lng
+        # Calculate movement metrics for consecutive pairs that both have
+        # coordinates and move forward in time
+        all_distances, all_time_diffs, all_speeds = consecutive_motion(lats, lngs, times_sec)
+        has_coords = ~np.isnan(lats)
+        valid = has_coords[1:] & has_coords[:-1] & (all_time_diffs > 0)
+        
+        speeds = all_speeds[valid]
+        distances = all_distances[valid]
+        time_intervals = all_time_diffs[valid]
+        locations = np.column_stack((lats[1:][valid], lngs[1:][valid]))  # lat, lng
+        
+        typical_locations = self._get_frequent_locations(locations)
+        
+        p95, p99 = np.percentile(speeds, [95, 99]) if speeds.size else (0, 0)
         
         # Calculate statistical profile
         profile = {
-            'avg_speed': np.mean(speeds) if speeds else 0,
-            'max_speed': np.max(speeds) if speeds else 0,
-            'speed_std': np.std(speeds) if speeds else 0,
-            'avg_distance': np.mean(distances) if distances else 0,
-            'avg_time_interval': np.mean(time_intervals) if time_intervals else 0,
-            'typical_locations': self._get_frequent_locations(locations),
+            'avg_speed': np.mean(speeds) if speeds.size else 0,
+            'max_speed': np.max(speeds) if speeds.size else 0,
+            'speed_std': np.std(speeds) if speeds.size else 0,
+            'avg_distance': np.mean(distances) if distances.size else 0,
+            'avg_time_interval': np.mean(time_intervals) if time_intervals.size else 0,
+            'typical_locations': typical_locations,
             'speed_percentiles': {
-                '95': np.percentile(speeds, 95) if speeds else 0,
-                '99': np.percentile(speeds, 99) if speeds else 0
+                '95': p95,
+                '99': p99
             }
         }
         
+        profile.update(self._index_typical_locations(typical_locations))
+        
         return profile
     
-    def _get_default_profile(self):
+    def _index_typical_locations(self, typical_locations):
         """
-        Default movement profile for new users
+        Precompute typical location centers for detection, once per profile
+        Centers are kept as a (K, 2) radians array; larger sets also get a
+        KD-tree on the unit sphere. typical_locations stays for readability
         """
-        return {
-            'avg_speed': 25.0,  # km/h
-            'max_speed': 60.0,
-            'speed_std': 15.0,
-            'avg_distance': 500.0,  # meters
-            'avg_time_interval': 300.0,  # seconds
-            'typical_locations': [],
-            'speed_percentiles': {
-                '95': 80.0,
-                '99': 120.0
-            }
-        }
+        if not typical_locations:
+            return {'_typical_centers_rad': None, '_typical_tree': None}
+        
+        centers = np.array([location['center'] for location in typical_locations])
+        tree = None
+        if len(centers) >= LOCATION_TREE_MIN_SIZE:
+            tree = cKDTree(to_unit_xyz(centers[:, 0], centers[:, 1]))
+        return {'_typical_centers_rad': np.radians(centers), '_typical_tree': tree}
     
     def _get_frequent_locations(self, locations, radius_m=100):
         """
         Find frequently visited locations
+        Longer histories are hashed into radius_m sized grid cells (equirectangular
+        projection around the mean latitude); cells with at least 3 visits are
+        reported at the centroid of their points
         """
         if len(locations) < 5:
             return []
         
-        # Simple clustering based on proximity
+        if len(locations) < GRID_MIN_POINTS:
+            return self._cluster_locations(locations, radius_m)
+        
+        coords = np.asarray(locations, dtype=np.float64)  # (N, 2) lat, lng
+        lats = coords[:, 0]
+        lngs = coords[:, 1]
+        
+        # Grid cell of every point, packed into one int64 key
+        mean_lat = math.radians(lats.mean())
+        cell_y = np.floor(lats * METERS_PER_DEGREE / radius_m).astype(np.int64)
+        cell_x = np.floor(lngs * METERS_PER_DEGREE * math.cos(mean_lat) / radius_m).astype(np.int64)
+        keys = (cell_y << 32) | (cell_x & 0xFFFFFFFF)
+        
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        center_lats = np.bincount(inverse, weights=lats) / counts
+        center_lngs = np.bincount(inverse, weights=lngs) / counts
+        
+        # Return cells with at least 3 visits
+        return [
+            {
+                'center': (lat, lng),
+                'visit_count': count
+            }
+            for lat, lng, count in zip(center_lats.tolist(), center_lngs.tolist(), counts.tolist())
+            if count >= 3
+        ]
+    
+    def _cluster_locations(self, locations, radius_m):
+        """
+        Proximity clustering for short histories: each location joins the
+        first cluster whose center is within radius_m
+        """
         clusters = []
-        for location in locations:
-            added_to_cluster = False
-            
+        for lat, lng in locations:
             for cluster in clusters:
-                # Check if location is close to cluster center
-                cluster_center = cluster['center']
-                distance = geodesic(location, cluster_center).meters
-                
-                if distance <= radius_m:
-                    cluster['points'].append(location)
-                    cluster['count'] += 1
-                    added_to_cluster = True
+                center_lat, center_lng = cluster['center']
+                if equirect_m(lat, lng, center_lat, center_lng) <= radius_m:
+                    cluster['visit_count'] += 1
                     break
-            
-            if not added_to_cluster:
-                clusters.append({
-                    'center': location,
-                    'points': [location],
-                    'count': 1
-                })
+            else:
+                clusters.append({'center': (float(lat), float(lng)), 'visit_count': 1})
         
         # Return clusters with at least 3 visits
-        frequent_locations = []
-        for cluster in clusters:
-            if cluster['count'] >= 3:
-                frequent_locations.append({
-                    'center': cluster['center'],
-                    'visit_count': cluster['count']
-                })
-        
-        return frequent_locations
+        return [cluster for cluster in clusters if cluster['visit_count'] >= 3]
     
     def _detect_speed_anomaly(self, processed_data, user_profile):
         """
         Detect speed-based anomalies
         """
         try:
-            speeds = [point['calculated_speed'] for point in processed_data if point['calculated_speed'] > 0]
+            # Only positive (moving) speeds are considered
+            max_speed = processed_data['max_speed']
+            max_change = processed_data['max_speed_change']
             
-            if not speeds:
+            if not processed_data['speed_count']:
                 return {'is_anomaly': False, 'confidence': 0.0, 'type': None}
             
-            max_speed = max(speeds)
-            avg_speed = np.mean(speeds)
-            
             # Check against absolute thresholds
             if max_speed > config.MOVEMENT_SPEED_THRESHOLD:
                 return {
@@ -270,17 +359,12 @@ class AnomalyDetector:
                 }
             
             # Check for sudden speed changes
-            speed_changes = []
-            for i in range(1, len(speeds)):
-                change = abs(speeds[i] - speeds[i-1])
-                speed_changes.append(change)
-            
-            if speed_changes and max(speed_changes) > 50:  # Sudden 50+ km/h change
+            if max_change > 50:  # Sudden 50+ km/h change
                 return {
                     'is_anomaly': True,
                     'confidence': 0.7,
                     'type': 'sudden_speed_change',
-                    'details': f'Sudden speed change detected: {max(speed_changes):.1f} km/h'
+                    'details': f'Sudden speed change detected: {max_change:.1f} km/h'
                 }
             
             return {'is_anomaly': False, 'confidence': 0.0, 'type': None}
@@ -294,35 +378,17 @@ class AnomalyDetector:
         Detect pattern-based anomalies
         """
         try:
-            if len(processed_data) < 3:
+            if len(processed_data['lats']) < 3:
                 return {'is_anomaly': False, 'confidence': 0.0, 'type': None}
             
-            # Check for erratic movement patterns
-            directions = []
-            for i in range(1, len(processed_data)):
-                curr = processed_data[i]
-                prev = processed_data[i-1]
-                
-                # Calculate bearing change
-                if curr['distance_from_prev'] > 10:  # Only for meaningful movements
-                    lat_diff = curr['lat'] - prev['lat']
-                    lng_diff = curr['lng'] - prev['lng']
-                    bearing = np.arctan2(lng_diff, lat_diff)
-                    directions.append(bearing)
+            # Check for erratic movement patterns: direction changes (0-π)
+            # between meaningful movements (> 10 m)
+            direction_changes = processed_data['direction_changes']
             
-            if len(directions) >= 3:
-                # Check for excessive direction changes
-                direction_changes = []
-                for i in range(1, len(directions)):
-                    change = abs(directions[i] - directions[i-1])
-                    # Normalize to 0-π
-                    if change > np.pi:
-                        change = 2*np.pi - change
-                    direction_changes.append(change)
-                
+            if direction_changes.size >= 2:  # at least 3 bearings
                 # If most direction changes are > 90 degrees, it's erratic
-                large_changes = sum(1 for change in direction_changes if change > np.pi/2)
-                erratic_ratio = large_changes / len(direction_changes)
+                large_changes = np.count_nonzero(direction_changes > np.pi/2)
+                erratic_ratio = large_changes / direction_changes.size
                 
                 if erratic_ratio > 0.7:  # 70% of movements are erratic
                     return {
@@ -343,24 +409,26 @@ class AnomalyDetector:
         Detect location-based anomalies
         """
         try:
-            if not user_profile['typical_locations']:
+            centers = user_profile.get('_typical_centers_rad')
+            if centers is None:
                 return {'is_anomaly': False, 'confidence': 0.0, 'type': None}
             
-            # Check if current locations are far from typical locations
-            current_locations = [(point['lat'], point['lng']) for point in processed_data]
-            
-            min_distances = []
-            for curr_loc in current_locations:
-                distances_to_typical = []
-                for typical_loc in user_profile['typical_locations']:
-                    distance = geodesic(curr_loc, typical_loc['center']).kilometers
-                    distances_to_typical.append(distance)
-                
-                if distances_to_typical:
-                    min_distances.append(min(distances_to_typical))
-            
-            if min_distances:
-                avg_distance_from_typical = np.mean(min_distances)
+            # Distance from each current location to its nearest typical location
+            lats = processed_data['lats']
+            lngs = processed_data['lngs']
+            tree = user_profile['_typical_tree']
+            if tree is not None:
+                chords, _ = tree.query(to_unit_xyz(lats, lngs), k=1)
+                min_distances = chord_to_km(chords)
+            else:
+                distances = hav_vec_rad(
+                    np.radians(lats)[:, None], np.radians(lngs)[:, None],
+                    centers[None, :, 0], centers[None, :, 1]
+                )
+                min_distances = distances.min(axis=1)
+            
+            if min_distances.size:
+                avg_distance_from_typical = min_distances.mean()
                 
                 # If average distance > 10km from typical locations
                 if avg_distance_from_typical > 10.0:
@@ -383,7 +451,7 @@ class AnomalyDetector:
         """
         try:
             # Check for unusual timing (very late night movement for non-night users)
-            current_hour = processed_data[0]['timestamp'].hour
+            current_hour = int(processed_data['hours'][0])
             
             # Simple heuristic: movement between 2 AM and 5 AM is unusual
             if 2 <= current_hour <= 5:
@@ -403,11 +471,19 @@ class AnomalyDetector:
     def _store_anomaly_result(self, user_id, location_data, anomaly_result):
         """
         Store anomaly detection result for future learning
+        Only anomalies are kept, with a compact summary of the track
         """
+        if not anomaly_result['is_anomaly']:
+            return
+        
         try:
             anomaly_data = {
                 'user_id': user_id,
-                'location_data_sample': location_data[:5],  # Store sample
+                'location_summary': {
+                    'start': self._location_point(location_data[0]),
+                    'end': self._location_point(location_data[-1]),
+                    'n_points': len(location_data)
+                },
                 'anomaly_result': anomaly_result,
                 'detection_timestamp': datetime.utcnow()
             }
@@ -415,4 +491,16 @@ class AnomalyDetector:
             self.db_client.store_anomaly_detection(anomaly_data)
             
         except Exception as e:
-            logger.error(f"Error storing anomaly result: {str(e)}")
\ No newline at end of file
+            logger.error(f"Error storing anomaly result: {str(e)}")
+    
+    def _location_point(self, row):
+        """
+        Convert a location row back to a plain BSON-safe dict for storage
+        """
+        lat, lng, ts, _, speed, accuracy = row.tolist()
+        point = {'lat': lat, 'lng': lng, 'timestamp': datetime.fromtimestamp(ts, timezone.utc)}
+        if not math.isnan(speed):
+            point['speed'] = speed
+        if not math.isnan(accuracy):
+            point['accuracy'] = accuracy
+        return point
\ No newline at end of file
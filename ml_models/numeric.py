@@ -0,0 +1,235 @@
+import math
+import numpy as np
+from distance.haversine import EARTH_RADIUS_KM, METERS_PER_DEGREE, equirect_vec_km, hav_vec
+
+# Numba is optional - without it the kernels fall back to vectorized numpy
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# Compiled kernels bake these in as constants, and their on-disk cache is keyed on
+# this file only: edit it (bumping its mtime) whenever the distance constants change
+EARTH_RADIUS_M = EARTH_RADIUS_KM * 1000
+KM_PER_DEGREE = METERS_PER_DEGREE / 1000
+
+if HAS_NUMBA:
+    # Explicit signatures compile eagerly at import (and are cached on disk),
+    # so the first request does not pay the JIT cost
+    @njit('Tuple((f8[:], f8[:], f8[:]))(f8[:], f8[:], f8[:])', cache=True, fastmath=True)
+    def consecutive_motion(lats, lngs, times_sec):
+        """
+        Distances (m), time gaps (s) and speeds (km/h) between consecutive fixes
+        Speed is 0 where time does not advance
+        """
+        n = max(lats.shape[0] - 1, 0)
+        distances = np.zeros(n)
+        time_diffs = np.zeros(n)
+        speeds = np.zeros(n)
+
+        for i in range(n):
+            lat1 = math.radians(lats[i])
+            lat2 = math.radians(lats[i+1])
+            dlat = lat2 - lat1
+            dlng = math.radians(lngs[i+1] - lngs[i])
+            a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+            distances[i] = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+
+            time_diffs[i] = times_sec[i+1] - times_sec[i]
+            if time_diffs[i] > 0:
+                speeds[i] = distances[i] / time_diffs[i] * 3.6  # m/s to km/h
+
+        return distances, time_diffs, speeds
+
+    @njit('Tuple((f8[:], f8[:], f8[:], f8[:], f8, f8, f8))(f8[:], f8[:], f8[:], f8[:], f8)', cache=True, fastmath=True)
+    def track_features(lats, lngs, times_sec, reported_speeds, min_distance):
+        """
+        Every per-track feature the anomaly detectors use, in a single pass
+        Returns per-point distance (m), time gap (s) and speed (km/h) from the
+        previous point (0 for the first; reported speed wins unless it is 0),
+        the bearing changes of moves longer than min_distance, and the count,
+        maximum and largest consecutive change of the positive speeds
+        """
+        n = lats.shape[0]
+        distances = np.zeros(n)
+        time_diffs = np.zeros(n)
+        speeds = np.zeros(n)
+        changes = np.empty(max(n - 2, 0))
+        n_changes = 0
+        previous_bearing = 0.0
+        have_bearing = False
+        count = 0
+        max_speed = 0.0
+        max_change = 0.0
+        previous_speed = 0.0
+
+        for i in range(1, n):
+            lat1 = math.radians(lats[i-1])
+            lat2 = math.radians(lats[i])
+            dlng = math.radians(lngs[i] - lngs[i-1])
+            a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+            distances[i] = 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(1.0, a)))
+            time_diffs[i] = times_sec[i] - times_sec[i-1]
+
+            if reported_speeds[i] == 0 and time_diffs[i] > 0:
+                speeds[i] = distances[i] / time_diffs[i] * 3.6  # m/s to km/h
+            else:
+                speeds[i] = reported_speeds[i]
+
+            if speeds[i] > 0:
+                if count > 0 and abs(speeds[i] - previous_speed) > max_change:
+                    max_change = abs(speeds[i] - previous_speed)
+                if speeds[i] > max_speed:
+                    max_speed = speeds[i]
+                previous_speed = speeds[i]
+                count += 1
+
+            if distances[i] > min_distance:
+                bearing = math.atan2(lngs[i] - lngs[i-1], lats[i] - lats[i-1])
+                if have_bearing:
+                    change = abs(bearing - previous_bearing)
+                    if change > math.pi:
+                        change = 2*math.pi - change
+                    changes[n_changes] = change
+                    n_changes += 1
+                previous_bearing = bearing
+                have_bearing = True
+
+        return distances, time_diffs, speeds, changes[:n_changes], float(count), max_speed, max_change
+
+    @njit('i8[:](f8[:], f8[:], f8, i8[:], i8, i8[:], i8[:])', cache=True, fastmath=True)
+    def leader_labels(lats, lngs, radius_km, keys, row_width, order, sorted_keys):
+        """
+        Leader clustering over a bucket_grid: each seed only tests the 3x3 cells around it
+        Returns a cluster label per point, numbered in seed order
+        """
+        n = lats.shape[0]
+        labels = np.full(n, -1, dtype=np.int64)
+        n_clusters = 0
+
+        for seed in range(n):
+            if labels[seed] >= 0:
+                continue
+            labels[seed] = n_clusters
+            kx = KM_PER_DEGREE * math.cos(math.radians(lats[seed]))
+            for row in range(-1, 2):
+                key = keys[seed] + row * row_width
+                lo = np.searchsorted(sorted_keys, key - 1, side='left')
+                hi = np.searchsorted(sorted_keys, key + 1, side='right')
+                for k in range(lo, hi):
+                    j = order[k]
+                    if labels[j] < 0:
+                        dx = (lngs[j] - lngs[seed]) * kx
+                        dy = (lats[j] - lats[seed]) * KM_PER_DEGREE
+                        if math.sqrt(dx * dx + dy * dy) <= radius_km:
+                            labels[j] = n_clusters
+            n_clusters += 1
+
+        return labels
+
+else:
+    def consecutive_motion(lats, lngs, times_sec):
+        """
+        Distances (m), time gaps (s) and speeds (km/h) between consecutive fixes
+        Speed is 0 where time does not advance
+        """
+        distances = hav_vec(lats[:-1], lngs[:-1], lats[1:], lngs[1:]) * 1000  # km to meters
+        time_diffs = np.diff(times_sec)
+        moving = time_diffs > 0
+        speeds = np.zeros_like(distances)
+        speeds[moving] = distances[moving] / time_diffs[moving] * 3.6  # m/s to km/h
+        return distances, time_diffs, speeds
+
+    def _bearing_changes(lats, lngs, distances, min_distance):
+        """
+        Direction changes (radians, folded into 0-pi) between consecutive moves
+        Only moves longer than min_distance (distances[i] is from point i-1 to i) count
+        """
+        moving = distances[1:] > min_distance
+        bearings = np.arctan2(np.diff(lngs)[moving], np.diff(lats)[moving])
+        changes = np.abs(np.diff(bearings))
+        return np.minimum(changes, 2*np.pi - changes)
+
+    def _speed_stats(speeds):
+        """
+        Count, maximum and largest consecutive change of the positive speeds
+        """
+        speeds = speeds[speeds > 0]
+        if not speeds.size:
+            return 0.0, 0.0, 0.0
+        return float(speeds.size), float(speeds.max()), float(np.abs(np.diff(speeds)).max(initial=0.0))
+
+    def track_features(lats, lngs, times_sec, reported_speeds, min_distance):
+        """
+        Every per-track feature the anomaly detectors use, in a single pass
+        Returns per-point distance (m), time gap (s) and speed (km/h) from the
+        previous point (0 for the first; reported speed wins unless it is 0),
+        the bearing changes of moves longer than min_distance, and the count,
+        maximum and largest consecutive change of the positive speeds
+        """
+        distances, time_diffs, speeds = consecutive_motion(lats, lngs, times_sec)
+        distances = np.concatenate(([0.0], distances))
+        time_diffs = np.concatenate(([0.0], time_diffs))
+        speeds = np.where(
+            (reported_speeds == 0) & (time_diffs > 0),
+            np.concatenate(([0.0], speeds)),
+            reported_speeds
+        )
+        speeds[:1] = 0
+        changes = _bearing_changes(lats, lngs, distances, min_distance)
+        return (distances, time_diffs, speeds, changes) + _speed_stats(speeds)
+
+    def leader_labels(lats, lngs, radius_km, keys, row_width, order, sorted_keys):
+        """
+        Leader clustering over a bucket_grid: each seed only tests the 3x3 cells around it
+        Returns a cluster label per point, numbered in seed order
+        """
+        n = lats.shape[0]
+        labels = np.full(n, -1, dtype=np.int64)
+        n_clusters = 0
+        next_seed = 0
+
+        while True:
+            # Scan forward to the next unlabelled point instead of searching the whole mask
+            while next_seed < n and labels[next_seed] >= 0:
+                next_seed += 1
+            if next_seed == n:
+                break
+            seed = next_seed
+            row_keys = keys[seed] + row_width * np.arange(-1, 2)
+            lo = np.searchsorted(sorted_keys, row_keys - 1, side='left')
+            hi = np.searchsorted(sorted_keys, row_keys + 1, side='right')
+            candidates = np.concatenate([order[start:end] for start, end in zip(lo, hi)])
+            candidates = candidates[labels[candidates] < 0]
+            distances = equirect_vec_km(lats[seed], lngs[seed], lats[candidates], lngs[candidates])
+            labels[candidates[distances <= radius_km]] = n_clusters
+            n_clusters += 1
+
+        return labels
+
+def bucket_grid(lats, lngs, cell_km):
+    """
+    Bucket points on a lat/lng grid whose cells are at least cell_km across
+    everywhere in the data (longitude cells are sized at the highest latitude)
+    Returns each point's cell key, the key stride between grid rows, and the
+    point order and keys sorted by cell, so a run of cells is one searchsorted range
+    """
+    cell_lat = max(cell_km, 1e-6) / KM_PER_DEGREE
+    cell_lng = cell_lat / max(math.cos(math.radians(np.abs(lats).max())), 1e-6)
+    rows = np.floor((lats - lats.min()) / cell_lat).astype(np.int64)
+    cols = np.floor((lngs - lngs.min()) / cell_lng).astype(np.int64) + 1  # Keep column 0 free as a row separator
+    row_width = int(cols.max()) + 2
+    keys = rows * row_width + cols
+    order = np.argsort(keys, kind='stable')
+    return keys, row_width, order, keys[order]
+
+def cluster_by_radius(lats, lngs, radius_km):
+    """
+    Leader clustering: the first unlabelled point seeds a cluster that takes
+    every unlabelled point within radius_km (equirectangular, scaled at the
+    seed's latitude). Returns a cluster label per point, numbered in seed order
+    """
+    if not lats.shape[0]:
+        return np.empty(0, dtype=np.int64)
+    return leader_labels(lats, lngs, radius_km, *bucket_grid(lats, lngs, radius_km))
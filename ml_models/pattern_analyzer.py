@@ -1,12 +1,61 @@
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime, timezone
 import logging
-from geopy.distance import geodesic
-from collections import defaultdict
+from ml_models.numeric import cluster_by_radius
+from collections import Counter
 import config
 
 logger = logging.getLogger(__name__)
 
+# Hotspot weights per incident severity and type, indexed by category code
+# (unknown severities count as 'medium', unknown types as 'other')
+SEVERITY_CODES = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+SEVERITY_WEIGHTS = np.array([1, 2, 3, 4], dtype=np.int64)
+TYPE_CODES = {'panic_alert': 0, 'crime': 1, 'accident': 2, 'medical': 3, 'fire': 4, 'other': 5}
+TYPE_WEIGHTS = np.array([3, 3, 2, 2, 2, 1], dtype=np.int64)
+
+def _utc_naive(timestamp):
+    """Parse an ISO string if needed and express the result as a naive UTC datetime"""
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+def _normalize_timestamps(timestamps):
+    """
+    datetime64[us] array (naive UTC) aligned with the given datetimes / ISO strings
+    Naive values are taken to be UTC already, as MongoDB returns them
+    """
+    return np.array([_utc_naive(timestamp) for timestamp in timestamps], dtype='datetime64[us]')
+
+def _located(documents):
+    """Documents whose location holds a [lng, lat] coordinate pair"""
+    return [document for document in documents
+            if len((document.get('location') or {}).get('coordinates') or ()) == 2]
+
+def _top_k(scores, k):
+    """
+    Indices of the k largest scores, highest first, in O(N + k log k)
+    Ties keep index order, exactly like a stable descending sort truncated to k
+    """
+    if len(scores) > k:
+        threshold = np.partition(scores, len(scores) - k)[len(scores) - k]
+        candidates = np.flatnonzero(scores >= threshold)
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+
+def _distribution(codes):
+    """
+    Count non-negative integer codes with np.bincount
+    Keys are ordered by first occurrence, like counting into a dict one event at a time
+    """
+    values, first_seen = np.unique(codes, return_index=True)
+    counts = np.bincount(codes)
+    ordered = values[np.argsort(first_seen)]
+    return dict(zip(ordered.tolist(), counts[ordered].tolist()))
+
 class PatternAnalyzer:
     def __init__(self, db_client):
         self.db_client = db_client
@@ -23,37 +72,26 @@ class PatternAnalyzer:
             start_date = datetime.fromisoformat(time_range['start'].replace('Z', '+00:00'))
             end_date = datetime.fromisoformat(time_range['end'].replace('Z', '+00:00'))
             
-            # Get incidents in the area
-            incidents = self.db_client.get_incidents_in_area(
+            # Get panic alerts on the read pool while incidents load here
+            panic_alerts_future = self.db_client.submit(
+                self.db_client.get_panic_alerts_in_area,
                 center_lat=center['lat'],
                 center_lng=center['lng'],
                 radius_km=radius,
                 start_date=start_date,
-                end_date=end_date,
-                incident_types=incident_types
+                end_date=end_date
             )
             
-            # Get panic alerts
-            panic_alerts = self.db_client.get_panic_alerts_in_area(
+            # Get incidents in the area
+            incidents = self.db_client.get_incidents_in_area(
                 center_lat=center['lat'],
                 center_lng=center['lng'],
                 radius_km=radius,
                 start_date=start_date,
-                end_date=end_date
+                end_date=end_date,
+                incident_types=incident_types
             )
-            
-            # Analyze patterns
-            hotspots = self._identify_hotspots(incidents, panic_alerts)
-            trends = self._analyze_trends(incidents, panic_alerts, start_date, end_date)
-            risk_zones = self._identify_risk_zones(incidents, panic_alerts, center, radius)
-            insights = self._generate_insights(incidents, panic_alerts, hotspots, trends)
-            
-            return {
-                'hotspots': hotspots,
-                'trends': trends,
-                'risk_zones': risk_zones,
-                'insights': insights
-            }
+            panic_alerts = panic_alerts_future.result()
             
         except Exception as e:
             logger.error(f"Error in pattern analysis: {str(e)}")
@@ -63,137 +101,128 @@ class PatternAnalyzer:
                 'risk_zones': [],
                 'insights': []
             }
+        
+        # Drop malformed locations once; the spatial analyses assume [lng, lat] pairs
+        located_incidents = _located(incidents)
+        located_alerts = _located(panic_alerts)
+        
+        # Analyze patterns (each step handles its own errors)
+        hotspots = self._identify_hotspots(located_incidents, located_alerts)
+        trends = self._analyze_trends(incidents, panic_alerts, start_date, end_date)
+        risk_zones = self._identify_risk_zones(located_incidents, located_alerts, center, radius)
+        insights = self._generate_insights(incidents, panic_alerts, hotspots, trends)
+        
+        return {
+            'hotspots': hotspots,
+            'trends': trends,
+            'risk_zones': risk_zones,
+            'insights': insights
+        }
     
     def _identify_hotspots(self, incidents, panic_alerts):
         """
         Identify incident hotspots using clustering
+        Expects incidents and alerts with valid locations (see _located)
         """
         try:
-            all_points = []
-            
-            # Add incident locations
-            for incident in incidents:
-                if 'location' in incident and 'coordinates' in incident['location']:
-                    coords = incident['location']['coordinates']  # [lng, lat]
-                    all_points.append({
-                        'lat': coords[1],
-                        'lng': coords[0],
-                        'type': 'incident',
-                        'subtype': incident.get('type', 'unknown'),
-                        'severity': incident.get('severity', 'medium'),
-                        'timestamp': incident.get('createdAt', datetime.utcnow())
-                    })
+            now = datetime.utcnow()  # One clock read for defaults and ranking
             
-            # Add panic alert locations
-            for alert in panic_alerts:
-                if 'location' in alert and 'coordinates' in alert['location']:
-                    coords = alert['location']['coordinates']  # [lng, lat]
-                    all_points.append({
-                        'lat': coords[1],
-                        'lng': coords[0],
-                        'type': 'panic_alert',
-                        'subtype': 'emergency',
-                        'severity': 'high',
-                        'timestamp': alert.get('timestamp', datetime.utcnow())
-                    })
-            
-            if len(all_points) < config.MIN_INCIDENTS_FOR_HOTSPOT:
+            if len(incidents) + len(panic_alerts) < config.MIN_INCIDENTS_FOR_HOTSPOT:
                 return []
             
-            # Simple clustering based on proximity
-            hotspots = self._cluster_points(all_points, config.HOTSPOT_RADIUS)
+            # Incident and panic alert locations as parallel arrays
+            coords = np.array(
+                [point['location']['coordinates'] for point in incidents + panic_alerts],
+                dtype=np.float64
+            )  # [lng, lat]
+            
+            # Subtype codes, combined severity x type weights and timestamps per point
+            subtypes = [incident.get('type', 'unknown') for incident in incidents] + ['emergency'] * len(panic_alerts)
+            subtype_index = {}
+            subtype_codes = np.array([subtype_index.setdefault(subtype, len(subtype_index)) for subtype in subtypes], dtype=np.intp)
+            severity_codes = np.array(
+                [SEVERITY_CODES.get(incident.get('severity', 'medium'), SEVERITY_CODES['medium']) for incident in incidents]
+                + [SEVERITY_CODES['high']] * len(panic_alerts),
+                dtype=np.intp
+            )
+            type_codes = np.array([TYPE_CODES.get(subtype, TYPE_CODES['other']) for subtype in subtypes], dtype=np.intp)
+            weights = SEVERITY_WEIGHTS[severity_codes] * TYPE_WEIGHTS[type_codes]
+            timestamps = _normalize_timestamps(
+                [incident.get('createdAt', now) for incident in incidents]
+                + [alert.get('timestamp', now) for alert in panic_alerts]
+            )
             
-            # Rank hotspots by severity and frequency
-            ranked_hotspots = self._rank_hotspots(hotspots)
+            # Simple clustering based on proximity
+            hotspots = self._cluster_points(coords[:, 1], coords[:, 0], config.HOTSPOT_RADIUS)
             
-            return ranked_hotspots[:10]  # Return top 10 hotspots
+            # Rank hotspots by severity and frequency, top 10 only
+            return self._rank_hotspots(hotspots, list(subtype_index), subtype_codes, weights, timestamps, now, limit=10)
             
         except Exception as e:
             logger.error(f"Error identifying hotspots: {str(e)}")
             return []
     
-    def _cluster_points(self, points, radius_km):
+    def _cluster_points(self, lats, lngs, radius_km):
         """
         Cluster points based on geographic proximity
+        Each cluster lists the indices of its member points
         """
         clusters = []
-        unclustered_points = points.copy()
+        labels = cluster_by_radius(lats, lngs, float(radius_km))
         
-        while unclustered_points:
-            # Start new cluster with first unclustered point
-            seed_point = unclustered_points.pop(0)
-            cluster = {
-                'center': {'lat': seed_point['lat'], 'lng': seed_point['lng']},
-                'points': [seed_point],
-                'incident_count': 1
-            }
-            
-            # Find nearby points
-            points_to_remove = []
-            for i, point in enumerate(unclustered_points):
-                distance = geodesic(
-                    (seed_point['lat'], seed_point['lng']),
-                    (point['lat'], point['lng'])
-                ).kilometers
-                
-                if distance <= radius_km:
-                    cluster['points'].append(point)
-                    cluster['incident_count'] += 1
-                    points_to_remove.append(i)
-            
-            # Remove clustered points
-            for i in reversed(points_to_remove):
-                unclustered_points.pop(i)
-            
-            # Update cluster center (centroid)
-            if len(cluster['points']) > 1:
-                avg_lat = np.mean([p['lat'] for p in cluster['points']])
-                avg_lng = np.mean([p['lng'] for p in cluster['points']])
-                cluster['center'] = {'lat': avg_lat, 'lng': avg_lng}
-            
+        # Group point indices by label; a stable sort keeps each cluster in input order
+        order = np.argsort(labels, kind='stable')
+        counts = np.bincount(labels)
+        
+        # Every cluster centroid in two weighted bincounts
+        center_lats = np.bincount(labels, weights=lats) / counts
+        center_lngs = np.bincount(labels, weights=lngs) / counts
+        
+        for label, members in enumerate(np.split(order, np.cumsum(counts)[:-1])):
             # Only include clusters with minimum incidents
-            if cluster['incident_count'] >= config.MIN_INCIDENTS_FOR_HOTSPOT:
-                clusters.append(cluster)
+            if len(members) < config.MIN_INCIDENTS_FOR_HOTSPOT:
+                continue
+            
+            clusters.append({
+                'center': {'lat': center_lats[label], 'lng': center_lngs[label]},
+                'members': members,
+                'incident_count': len(members)
+            })
         
         return clusters
     
-    def _rank_hotspots(self, clusters):
+    def _rank_hotspots(self, clusters, subtype_names, subtype_codes, weights, timestamps, now, limit=10):
         """
-        Rank hotspots by risk level
+        Rank hotspots by risk level and return the top `limit`
+        subtype_codes, weights and timestamps are per-point arrays indexed by cluster members;
+        now is the caller's naive UTC clock reading, shared with its timestamp defaults
         """
         ranked = []
+        now = np.datetime64(now, 'us')
+        recent_cutoff = now - np.timedelta64(7, 'D')
+        scores = np.empty(len(clusters))
         
-        for cluster in clusters:
-            # Calculate risk score
-            risk_score = 0
-            severity_weights = {'low': 1, 'medium': 2, 'high': 3, 'critical': 4}
-            type_weights = {'panic_alert': 3, 'crime': 3, 'accident': 2, 'medical': 2, 'fire': 2, 'other': 1}
+        for n, cluster in enumerate(clusters):
+            members = cluster['members']
             
-            for point in cluster['points']:
-                severity_weight = severity_weights.get(point['severity'], 2)
-                type_weight = type_weights.get(point['subtype'], 1)
-                risk_score += severity_weight * type_weight
+            # Calculate risk score
+            risk_score = int(weights[members].sum())
             
             # Normalize by time (recent incidents get higher weight)
-            now = datetime.utcnow()
-            time_weights = []
-            for point in cluster['points']:
-                if isinstance(point['timestamp'], str):
-                    timestamp = datetime.fromisoformat(point['timestamp'].replace('Z', '+00:00'))
-                else:
-                    timestamp = point['timestamp']
-                
-                days_old = (now - timestamp).days
-                time_weight = max(0.1, 1.0 - (days_old / 30))  # Decay over 30 days
-                time_weights.append(time_weight)
-            
-            avg_time_weight = np.mean(time_weights) if time_weights else 1.0
-            final_score = risk_score * avg_time_weight
+            days_old = (now - timestamps[members]) // np.timedelta64(1, 'D')
+            time_weights = np.maximum(0.1, 1.0 - days_old / 30)  # Decay over 30 days
+            scores[n] = risk_score * time_weights.mean()
+        
+        # Only the highest scoring clusters are turned into hotspot dicts
+        for n in _top_k(np.round(scores, 2), limit):
+            cluster = clusters[n]
+            members = cluster['members']
+            final_score = scores[n]
             
             # Get incident breakdown
-            incident_breakdown = defaultdict(int)
-            for point in cluster['points']:
-                incident_breakdown[point['subtype']] += 1
+            incident_breakdown = {
+                subtype_names[code]: count for code, count in _distribution(subtype_codes[members]).items()
+            }
             
             hotspot = {
                 'center': cluster['center'],
@@ -201,17 +230,13 @@ class PatternAnalyzer:
                 'risk_score': round(final_score, 2),
                 'risk_level': self._get_risk_level(final_score),
                 'radius_km': config.HOTSPOT_RADIUS,
-                'incident_breakdown': dict(incident_breakdown),
+                'incident_breakdown': incident_breakdown,
                 'most_common_type': max(incident_breakdown.items(), key=lambda x: x[1])[0],
-                'recent_incidents': len([p for p in cluster['points'] 
-                                       if self._is_recent(p['timestamp'], days=7)])
+                'recent_incidents': int(np.count_nonzero(timestamps[members] >= recent_cutoff))
             }
             
             ranked.append(hotspot)
         
-        # Sort by risk score (descending)
-        ranked.sort(key=lambda x: x['risk_score'], reverse=True)
-        
         return ranked
     
     def _analyze_trends(self, incidents, panic_alerts, start_date, end_date):
@@ -219,51 +244,24 @@ class PatternAnalyzer:
         Analyze temporal trends in incident data
         """
         try:
-            # Time-based analysis
-            hourly_distribution = defaultdict(int)
-            daily_distribution = defaultdict(int)
-            weekly_distribution = defaultdict(int)
-            type_distribution = defaultdict(int)
-            
-            all_events = []
-            
-            # Process incidents
-            for incident in incidents:
-                timestamp = incident.get('createdAt', start_date)
-                if isinstance(timestamp, str):
-                    timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                
-                all_events.append({
-                    'timestamp': timestamp,
-                    'type': incident.get('type', 'unknown'),
-                    'severity': incident.get('severity', 'medium')
-                })
+            # Parse every stamp once (strings and aware datetimes become naive UTC)
+            stamps = _normalize_timestamps(
+                [incident.get('createdAt', start_date) for incident in incidents]
+                + [alert.get('timestamp', start_date) for alert in panic_alerts]
+            )
+            event_types = [incident.get('type', 'unknown') for incident in incidents] + ['panic_alert'] * len(panic_alerts)
             
-            # Process panic alerts
-            for alert in panic_alerts:
-                timestamp = alert.get('timestamp', start_date)
-                if isinstance(timestamp, str):
-                    timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-                
-                all_events.append({
-                    'timestamp': timestamp,
-                    'type': 'panic_alert',
-                    'severity': 'high'
-                })
+            # Analyze distributions - bucket codes computed on datetime64 in one pass
+            hours = stamps.astype('datetime64[h]').astype(np.int64) % 24
+            weekdays = (stamps.astype('datetime64[D]').astype(np.int64) + 3) % 7  # 0=Monday, 6=Sunday (1970-01-01 was a Thursday)
             
-            # Analyze distributions
-            for event in all_events:
-                ts = event['timestamp']
-                
-                hourly_distribution[ts.hour] += 1
-                daily_distribution[ts.weekday()] += 1  # 0=Monday, 6=Sunday
-                week_number = ts.isocalendar()[1]
-                weekly_distribution[week_number] += 1
-                type_distribution[event['type']] += 1
+            hourly_distribution = _distribution(hours)
+            daily_distribution = _distribution(weekdays)
+            type_distribution = Counter(event_types)
             
             # Calculate trends
             total_days = (end_date - start_date).days
-            daily_average = len(all_events) / max(1, total_days)
+            daily_average = len(stamps) / max(1, total_days)
             
             # Identify peak hours
             peak_hour = max(hourly_distribution.items(), key=lambda x: x[1])[0] if hourly_distribution else 12
@@ -280,7 +278,7 @@ class PatternAnalyzer:
                 'hourly_distribution': dict(hourly_distribution),
                 'daily_distribution': {day_names[k]: v for k, v in daily_distribution.items()},
                 'type_distribution': dict(type_distribution),
-                'trend_direction': self._calculate_trend_direction(all_events, total_days)
+                'trend_direction': self._calculate_trend_direction(stamps, start_date, end_date, total_days)
             }
             
         except Exception as e:
@@ -290,6 +288,7 @@ class PatternAnalyzer:
     def _identify_risk_zones(self, incidents, panic_alerts, center, radius_km):
         """
         Identify specific risk zones within the area
+        Expects incidents and alerts with valid locations (see _located)
         """
         try:
             # Divide area into grid cells for analysis
@@ -303,54 +302,48 @@ class PatternAnalyzer:
             lat_range = radius_km / 111.0  # Rough conversion km to degrees
             lng_range = radius_km / (111.0 * np.cos(np.radians(center_lat)))
             
-            for lat_offset in np.arange(-lat_range, lat_range, grid_size):
-                for lng_offset in np.arange(-lng_range, lng_range, grid_size):
-                    grid_lat = center_lat + lat_offset
-                    grid_lng = center_lng + lng_offset
-                    
-                    # Count incidents in this grid cell
-                    incidents_in_cell = 0
-                    alerts_in_cell = 0
-                    
-                    for incident in incidents:
-                        if 'location' in incident and 'coordinates' in incident['location']:
-                            coords = incident['location']['coordinates']
-                            inc_lat, inc_lng = coords[1], coords[0]
-                            
-                            if (abs(inc_lat - grid_lat) <= grid_size/2 and 
-                                abs(inc_lng - grid_lng) <= grid_size/2):
-                                incidents_in_cell += 1
-                    
-                    for alert in panic_alerts:
-                        if 'location' in alert and 'coordinates' in alert['location']:
-                            coords = alert['location']['coordinates']
-                            alert_lat, alert_lng = coords[1], coords[0]
-                            
-                            if (abs(alert_lat - grid_lat) <= grid_size/2 and 
-                                abs(alert_lng - grid_lng) <= grid_size/2):
-                                alerts_in_cell += 1
-                    
-                    # Calculate risk for this cell
-                    cell_risk = incidents_in_cell * 2 + alerts_in_cell * 3
-                    
-                    if cell_risk >= 3:  # Minimum threshold for risk zone
-                        risk_zones.append({
-                            'center': {'lat': grid_lat, 'lng': grid_lng},
-                            'bounds': {
-                                'north': grid_lat + grid_size/2,
-                                'south': grid_lat - grid_size/2,
-                                'east': grid_lng + grid_size/2,
-                                'west': grid_lng - grid_size/2
-                            },
-                            'risk_score': cell_risk,
-                            'incident_count': incidents_in_cell,
-                            'alert_count': alerts_in_cell,
-                            'risk_level': self._get_risk_level(cell_risk * 10)  # Scale up for level calculation
-                        })
+            # Cell centers, and bin edges half a cell either side of them
+            grid_lats = center_lat + np.arange(-lat_range, lat_range, grid_size)
+            grid_lngs = center_lng + np.arange(-lng_range, lng_range, grid_size)
+            lat_edges = np.append(grid_lats - grid_size/2, grid_lats[-1] + grid_size/2)
+            lng_edges = np.append(grid_lngs - grid_size/2, grid_lngs[-1] + grid_size/2)
+            
+            # Count incidents and alerts per grid cell
+            incident_coords = np.array([incident['location']['coordinates'] for incident in incidents],
+                                       dtype=np.float64).reshape(-1, 2)  # [lng, lat]
+            alert_coords = np.array([alert['location']['coordinates'] for alert in panic_alerts],
+                                    dtype=np.float64).reshape(-1, 2)
+            
+            incident_grid, _, _ = np.histogram2d(incident_coords[:, 1], incident_coords[:, 0], bins=[lat_edges, lng_edges])
+            alert_grid, _, _ = np.histogram2d(alert_coords[:, 1], alert_coords[:, 0], bins=[lat_edges, lng_edges])
+            
+            # Calculate risk for each cell
+            risk_grid = incident_grid * 2 + alert_grid * 3
+            
+            # Rank qualifying cells on the flat score array and only build dicts
+            # for the top 20 (row-major order among ties)
+            cells = np.flatnonzero(risk_grid >= 3)  # Minimum threshold for risk zone
+            top_cells = cells[_top_k(risk_grid.ravel()[cells], 20)]
+            
+            for i, j in zip(*np.unravel_index(top_cells, risk_grid.shape)):
+                grid_lat = grid_lats[i]
+                grid_lng = grid_lngs[j]
+                cell_risk = int(risk_grid[i, j])
+                risk_zones.append({
+                    'center': {'lat': grid_lat, 'lng': grid_lng},
+                    'bounds': {
+                        'north': grid_lat + grid_size/2,
+                        'south': grid_lat - grid_size/2,
+                        'east': grid_lng + grid_size/2,
+                        'west': grid_lng - grid_size/2
+                    },
+                    'risk_score': cell_risk,
+                    'incident_count': int(incident_grid[i, j]),
+                    'alert_count': int(alert_grid[i, j]),
+                    'risk_level': self._get_risk_level(cell_risk * 10)  # Scale up for level calculation
+                })
             
-            # Sort by risk score and return top zones
-            risk_zones.sort(key=lambda x: x['risk_score'], reverse=True)
-            return risk_zones[:20]  # Top 20 risk zones
+            return risk_zones  # Top 20 risk zones, highest risk first
             
         except Exception as e:
             logger.error(f"Error identifying risk zones: {str(e)}")
@@ -424,22 +417,20 @@ class PatternAnalyzer:
             logger.error(f"Error generating insights: {str(e)}")
             return []
     
-    def _calculate_trend_direction(self, events, total_days):
+    def _calculate_trend_direction(self, stamps, start_date, end_date, total_days):
         """
         Calculate whether incidents are increasing, decreasing, or stable
         """
-        if len(events) < 4 or total_days < 7:
+        if len(stamps) < 4 or total_days < 7:
             return 'insufficient_data'
         
-        # Split period into two halves
-        sorted_events = sorted(events, key=lambda x: x['timestamp'])
-        mid_point = len(sorted_events) // 2
+        # Split period into two halves at its midpoint in time and count events on each side
+        midpoint = np.datetime64(_utc_naive(start_date + (end_date - start_date) / 2), 'us')
+        first_half = int(np.count_nonzero(stamps < midpoint))
+        second_half = len(stamps) - first_half
         
-        first_half = sorted_events[:mid_point]
-        second_half = sorted_events[mid_point:]
-        
-        first_half_rate = len(first_half) / (total_days / 2)
-        second_half_rate = len(second_half) / (total_days / 2)
+        first_half_rate = first_half / (total_days / 2)
+        second_half_rate = second_half / (total_days / 2)
         
         change_ratio = second_half_rate / first_half_rate if first_half_rate > 0 else 1
         
@@ -459,12 +450,4 @@ class PatternAnalyzer:
         elif score < 35:
             return 'high'
         else:
-            return 'critical'
-    
-    def _is_recent(self, timestamp, days=7):
-        """Check if timestamp is within recent days"""
-        if isinstance(timestamp, str):
-            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-        
-        cutoff = datetime.utcnow() - timedelta(days=days)
-        return timestamp >= cutoff
\ No newline at end of file
+            return 'critical'
\ No newline at end of file
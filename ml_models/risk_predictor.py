@@ -1,21 +1,52 @@
-import numpy as np
 from datetime import datetime, timedelta
 import logging
-from geopy.distance import geodesic
+import threading
+import time
+import numpy as np
+from cachetools import TTLCache
+from scipy.spatial import cKDTree
+from distance.haversine import hav_scalar, km_to_chord, to_unit_xyz
 import config
 
 logger = logging.getLogger(__name__)
 
+# Point risk weights, indexed by category code (unknown values count as 'other' / 'medium')
+INCIDENT_TYPE_CODES = {'crime': 0, 'accident': 1, 'medical': 2, 'fire': 3, 'other': 4}
+INCIDENT_TYPE_WEIGHTS = np.array([3.0, 2.0, 1.5, 2.5, 1.0])
+SEVERITY_CODES = {'low': 0, 'medium': 1, 'high': 2, 'critical': 3}
+SEVERITY_MULTIPLIERS = np.array([0.5, 1.0, 1.5, 2.0])
+
+# Route risk multiplier per time of day (anything else counts as 1.0)
+_TIME_MODS = {
+    'morning': 0.8,      # Lower risk during morning
+    'afternoon': 0.9,    # Lower risk during afternoon
+    'evening': 1.1,      # Slightly higher risk in evening
+    'night': 1.3,        # Higher risk at night
+    'late_night': 1.5    # Highest risk late at night
+}
+
 class RiskPredictor:
     def __init__(self, db_client):
         self.db_client = db_client
         self.model = None
-        self.risk_cache = {}  # Simple cache for performance
+        
+        # Per-location (incidents, panic alerts), keyed by quantized coordinates
+        self.risk_cache = TTLCache(maxsize=config.RISK_CACHE_SIZE, ttl=config.RISK_CACHE_TTL)
+        self._risk_cache_lock = threading.Lock()
+        
+        # In-memory KD-tree over the last year of incidents, rebuilt on the read
+        # pool every INCIDENT_INDEX_TTL seconds; route points query it instead of MongoDB
+        self._tree = None
+        self._tree_points = None
+        self._tree_built_at = None
+        self._tree_refreshing = False
+        self._tree_lock = threading.Lock()
     
-    def predict_route_risk(self, route, time_of_day='day', user_id=None):
+    def predict_route_risk(self, route, time_of_day='day', user_id=None, point_risks=None):
         """
         Predict risk score for a given route based on historical data
         Returns a score from 0-100 (higher = more risky)
+        point_risks optionally memoizes per-point risk across several routes
         """
         try:
             start_point = route['start']
@@ -23,7 +54,7 @@ class RiskPredictor:
             waypoints = route.get('waypoints', [])
             
             # Calculate base risk from historical incidents
-            base_risk = self._calculate_historical_risk(start_point, end_point, waypoints)
+            base_risk = self._calculate_historical_risk(start_point, end_point, waypoints, point_risks)
             
             # Apply time-based modifiers
             time_modifier = self._get_time_risk_modifier(time_of_day)
@@ -53,36 +84,53 @@ class RiskPredictor:
             logger.error(f"Error in risk prediction: {str(e)}")
             return 30.0  # Default moderate risk
     
-    def _calculate_historical_risk(self, start_point, end_point, waypoints):
+    def predict_route_risk_batch(self, routes, time_of_day='day', user_id=None):
+        """
+        Predict risk scores for several routes in one call
+        The points of all routes are looked up together up front, so the whole
+        batch costs one query per collection and shared points are scored once
+        """
+        point_risks = {}
+        try:
+            self._score_points(
+                [point for route in routes for point in [route['start']] + route.get('waypoints', []) + [route['end']]],
+                point_risks
+            )
+        except Exception as e:
+            # Routes fall back to scoring their own points
+            logger.error(f"Error pre-scoring route batch: {str(e)}")
+        
+        return [
+            self.predict_route_risk(route, time_of_day=time_of_day, user_id=user_id, point_risks=point_risks)
+            for route in routes
+        ]
+    
+    def _score_points(self, points, point_risks):
+        """
+        Calculate the risk of every point not already in point_risks (last year of data)
+        Unscored points are looked up in one batch; returns each point's risk key
+        """
+        keys = [self._area_key(point['lat'], point['lng'], config.RISK_PREDICTION_RADIUS, 365) for point in points]
+        pending = {key: (point['lat'], point['lng']) for key, point in zip(keys, points) if key not in point_risks}
+        if pending:
+            areas = self._fetch_areas(list(pending.values()), config.RISK_PREDICTION_RADIUS, 365, self._incident_index())
+            for key, (incidents, panic_alerts) in zip(pending, areas):
+                # Calculate risk for this point
+                point_risks[key] = self._calculate_point_risk(incidents, panic_alerts)
+        return keys
+    
+    def _calculate_historical_risk(self, start_point, end_point, waypoints, point_risks=None):
         """
         Calculate risk based on historical incident data
         """
         try:
             all_points = [start_point] + waypoints + [end_point]
-            total_risk = 0
-            point_count = 0
-            
-            for point in all_points:
-                # Get incidents within radius of this point
-                incidents = self.db_client.get_incidents_in_area(
-                    center_lat=point['lat'],
-                    center_lng=point['lng'],
-                    radius_km=config.RISK_PREDICTION_RADIUS,
-                    start_date=datetime.utcnow() - timedelta(days=365)  # Last year
-                )
-                
-                # Get panic alerts
-                panic_alerts = self.db_client.get_panic_alerts_in_area(
-                    center_lat=point['lat'],
-                    center_lng=point['lng'],
-                    radius_km=config.RISK_PREDICTION_RADIUS,
-                    start_date=datetime.utcnow() - timedelta(days=365)
-                )
-                
-                # Calculate risk for this point
-                point_risk = self._calculate_point_risk(incidents, panic_alerts)
-                total_risk += point_risk
-                point_count += 1
+            if point_risks is None:
+                point_risks = {}
+            
+            keys = self._score_points(all_points, point_risks)
+            total_risk = sum(point_risks[key] for key in keys)
+            point_count = len(keys)
             
             # Average risk across all points
             avg_risk = total_risk / point_count if point_count > 0 else 20
@@ -93,37 +141,122 @@ class RiskPredictor:
             logger.error(f"Error calculating historical risk: {str(e)}")
             return 20.0  # Default base risk
     
+    def _area_key(self, lat, lng, radius_km, window_days):
+        """Cache key for an area lookup - coordinates quantized to ~100 m"""
+        return (round(lat, 3), round(lng, 3), radius_km, window_days)
+    
+    def _fetch_areas(self, points, radius_km, window_days, index=None):
+        """
+        Incidents and panic alerts within radius_km of each (lat, lng) point over the last window_days
+        Uncached points are fetched with one query per collection. Results are
+        cached per quantized location, so nearby points and routes sharing
+        segments skip the lookups; the returned lists must not be mutated
+        """
+        keys = [self._area_key(lat, lng, radius_km, window_days) for lat, lng in points]
+        with self._risk_cache_lock:
+            results = [self.risk_cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        
+        centers = [points[i] for i in missing]
+        start_date = datetime.utcnow() - timedelta(days=window_days)
+        
+        # Get panic alerts on the read pool while incidents load here
+        panic_alerts_future = self.db_client.submit(
+            self.db_client.get_panic_alerts_in_areas, centers, radius_km, start_date=start_date
+        )
+        
+        if index is not None:
+            incidents = [self._query_tree(index, lat, lng, radius_km) for lat, lng in centers]
+        else:
+            incidents = self.db_client.get_incidents_in_areas(centers, radius_km, start_date=start_date)
+        panic_alerts = panic_alerts_future.result()
+        
+        # A failed query (None) scores as no data for this call only - never cache
+        # it, or one transient error would pin these points at minimum risk
+        failed = incidents is None or panic_alerts is None
+        empty = [[] for _ in centers]
+        for i, result in zip(missing, zip(incidents or empty, panic_alerts or empty)):
+            results[i] = result
+        if not failed:
+            with self._risk_cache_lock:
+                for i in missing:
+                    self.risk_cache[keys[i]] = results[i]
+        return results
+    
+    def _incident_index(self):
+        """
+        Return the (tree, incidents) index, or None while it is missing or stale
+        A stale index triggers one background rebuild; callers use MongoDB meanwhile
+        """
+        if config.INCIDENT_INDEX_TTL <= 0:
+            return None
+        
+        with self._tree_lock:
+            fresh = self._tree_built_at is not None and time.monotonic() - self._tree_built_at < config.INCIDENT_INDEX_TTL
+            refresh = not fresh and not self._tree_refreshing
+            if refresh:
+                self._tree_refreshing = True
+            index = (self._tree, self._tree_points)
+        
+        if refresh:
+            self.db_client.submit(self._refresh_tree)
+        return index if fresh and index[0] is not None else None
+    
+    def _refresh_tree(self):
+        """
+        Rebuild the incident KD-tree from the last year of incidents
+        Points are indexed on the unit sphere, so a ball query with the chord
+        length of the search radius is an exact great-circle range query
+        """
+        try:
+            incidents = self.db_client.get_recent_incidents(
+                start_date=datetime.utcnow() - timedelta(days=365),
+                limit=config.INCIDENT_INDEX_MAX_SIZE + 1
+            )
+            tree = None
+            if incidents is None:
+                # Query failed - keep the previous index (if any) until the next attempt
+                tree, incidents = self._tree, self._tree_points
+            elif len(incidents) > config.INCIDENT_INDEX_MAX_SIZE:
+                logger.warning(f"Over {config.INCIDENT_INDEX_MAX_SIZE} incidents, not indexing in memory")
+                incidents = None
+            else:
+                incidents = [incident for incident in incidents if len(incident.get('location', {}).get('coordinates', ())) == 2]
+                coords = np.array([incident['location']['coordinates'] for incident in incidents], dtype=np.float64).reshape(-1, 2)
+                tree = cKDTree(to_unit_xyz(coords[:, 1], coords[:, 0]))
+            
+            with self._tree_lock:
+                self._tree, self._tree_points = tree, incidents
+                self._tree_built_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"Error building incident index: {str(e)}")
+        finally:
+            with self._tree_lock:
+                self._tree_refreshing = False
+    
+    def _query_tree(self, index, lat, lng, radius_km):
+        """Incidents within radius_km of a point, from the in-memory index"""
+        tree, incidents = index
+        idxs = tree.query_ball_point(to_unit_xyz(lat, lng)[0], km_to_chord(radius_km), return_sorted=True)
+        return [incidents[i] for i in idxs]
+    
     def _calculate_point_risk(self, incidents, panic_alerts):
         """
         Calculate risk score for a specific point based on incident density
         """
         try:
-            # Weight different incident types
-            incident_weights = {
-                'crime': 3.0,
-                'accident': 2.0,
-                'medical': 1.5,
-                'fire': 2.5,
-                'other': 1.0
-            }
-            
-            # Calculate weighted incident score
-            incident_score = 0
-            for incident in incidents:
-                incident_type = incident.get('type', 'other')
-                severity = incident.get('severity', 'medium')
-                
-                weight = incident_weights.get(incident_type, 1.0)
-                
-                # Severity multiplier
-                severity_multiplier = {
-                    'low': 0.5,
-                    'medium': 1.0,
-                    'high': 1.5,
-                    'critical': 2.0
-                }.get(severity, 1.0)
-                
-                incident_score += weight * severity_multiplier
+            # Calculate weighted incident score from type and severity codes
+            type_codes = np.fromiter(
+                (INCIDENT_TYPE_CODES.get(incident.get('type', 'other'), INCIDENT_TYPE_CODES['other']) for incident in incidents),
+                dtype=np.intp, count=len(incidents)
+            )
+            severity_codes = np.fromiter(
+                (SEVERITY_CODES.get(incident.get('severity', 'medium'), SEVERITY_CODES['medium']) for incident in incidents),
+                dtype=np.intp, count=len(incidents)
+            )
+            incident_score = float((INCIDENT_TYPE_WEIGHTS[type_codes] * SEVERITY_MULTIPLIERS[severity_codes]).sum())
             
             # Add panic alert score (each alert adds fixed risk)
             panic_score = len(panic_alerts) * 2.0
@@ -145,15 +278,7 @@ class RiskPredictor:
         """
         Get risk modifier based on time of day
         """
-        time_modifiers = {
-            'morning': 0.8,      # Lower risk during morning
-            'afternoon': 0.9,    # Lower risk during afternoon
-            'evening': 1.1,      # Slightly higher risk in evening
-            'night': 1.3,        # Higher risk at night
-            'late_night': 1.5    # Highest risk late at night
-        }
-        
-        return time_modifiers.get(time_of_day, 1.0)
+        return _TIME_MODS.get(time_of_day, 1.0)
     
     def _get_route_characteristics_modifier(self, route):
         """
@@ -164,10 +289,7 @@ class RiskPredictor:
             end = route['end']
             
             # Calculate route distance
-            distance = geodesic(
-                (start['lat'], start['lng']),
-                (end['lat'], end['lng'])
-            ).kilometers
+            distance = hav_scalar(start['lat'], start['lng'], end['lat'], end['lng'])
             
             # Distance modifier (longer routes have slightly higher risk)
             distance_modifier = 1.0 + (distance / 100) * 0.1  # +10% per 100km
@@ -196,20 +318,8 @@ class RiskPredictor:
         Get risk summary for a specific area
         """
         try:
-            # Get recent incidents
-            incidents = self.db_client.get_incidents_in_area(
-                center_lat=center_lat,
-                center_lng=center_lng,
-                radius_km=radius_km,
-                start_date=datetime.utcnow() - timedelta(days=30)
-            )
-            
-            panic_alerts = self.db_client.get_panic_alerts_in_area(
-                center_lat=center_lat,
-                center_lng=center_lng,
-                radius_km=radius_km,
-                start_date=datetime.utcnow() - timedelta(days=30)
-            )
+            # Get recent incidents and panic alerts
+            incidents, panic_alerts = self._fetch_areas([(center_lat, center_lng)], radius_km, 30)[0]
             
             # Calculate area risk
             area_risk = self._calculate_point_risk(incidents, panic_alerts)
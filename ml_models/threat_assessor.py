@@ -0,0 +1,76 @@
+import bisect
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Additive threat rules: (context key, value, score, contributing factor)
+DEFAULT_RULES = [
+    ('time_of_day', 'night', 15, 'Late hour increases risk'),
+    ('time_of_day', 'late_evening', 15, 'Late hour increases risk'),
+    ('time_of_day', 'evening', 8, 'Evening hours have moderate risk'),
+    ('weather', 'rainy', 10, 'Poor weather conditions'),
+    ('weather', 'foggy', 10, 'Poor weather conditions')
+]
+
+BASE_SCORE = 20
+THRESHOLDS = (30, 50, 70)
+LEVELS = ('low', 'moderate', 'high', 'critical')
+RECOMMENDATIONS = (
+    ['Normal safety precautions'],
+    ['Increased awareness recommended', 'Share location with contacts'],
+    ['Exercise caution', 'Consider alternative routes'],
+    ['Avoid area if possible', 'Contact emergency services if in danger']
+)
+
+class ThreatAssessor:
+    def __init__(self, rules=None):
+        self._rules = None
+        self.load_rules(rules or DEFAULT_RULES)
+
+    def load_rules(self, rules):
+        """
+        Replace the rule table without restarting the service
+        Rules are stored as parallel tuples (keys, values, scores, factors) and
+        swapped in with a single assignment so concurrent requests never see a
+        half-updated table
+        """
+        keys, values, scores, factors = zip(*rules)
+        self._rules = (keys, values, scores, factors)
+
+    def load_rules_file(self, path):
+        """
+        Load rules from a JSON file of {"key", "value", "score", "factor"} objects
+        Keeps the current rules if the file cannot be read
+        """
+        try:
+            with open(path) as f:
+                rules = [(r['key'], r['value'], int(r['score']), r['factor']) for r in json.load(f)]
+            self.load_rules(rules)
+            logger.info(f"Loaded {len(rules)} threat rules from {path}")
+        except Exception as e:
+            logger.error(f"Error loading threat rules from {path}: {str(e)}")
+
+    def assess_threat_level(self, location, user_profile, context):
+        """
+        Basic threat level assessment combining multiple factors
+        This is a simplified MVP implementation
+        """
+        keys, values, scores, factors = self._rules
+
+        # Context based risk factors (time of day, weather, ...)
+        matched = [i for i, (key, value) in enumerate(zip(keys, values)) if context.get(key) == value]
+        base_score = BASE_SCORE + sum(scores[i] for i in matched)
+
+        # Get historical incident data for the location
+        # This would integrate with the pattern analyzer
+
+        # Determine level
+        index = bisect.bisect_right(THRESHOLDS, base_score)
+
+        return {
+            'level': LEVELS[index],
+            'score': min(100, base_score),
+            'factors': [factors[i] for i in matched],
+            'recommendations': list(RECOMMENDATIONS[index])
+        }
@@ -0,0 +1,72 @@
+from typing import Any, Dict, List, Literal, Optional
+from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+import config
+
+# Request payload models - parsed and validated in one pass by pydantic-core
+
+class Coordinates(BaseModel):
+    lat: float
+    lng: float
+
+class Route(BaseModel):
+    start: Coordinates
+    end: Coordinates
+    waypoints: List[Coordinates] = []
+
+class RouteRequest(BaseModel):
+    route: Route
+    time_of_day: str = 'day'
+    user_id: Optional[str] = None
+
+class RouteBatchRequest(BaseModel):
+    routes: List[Route] = Field(min_length=1, max_length=config.MAX_BATCH_ROUTES)
+    time_of_day: str = 'day'
+    user_id: Optional[str] = None
+
+class LocationPoint(BaseModel):
+    lat: float
+    lng: float
+    timestamp: str
+    speed: Optional[float] = None
+    accuracy: Optional[float] = None
+    
+    @field_validator('timestamp')
+    @classmethod
+    def _iso_timestamp(cls, value):
+        """Reject timestamps the anomaly detector cannot parse (kept as the original string)"""
+        try:
+            datetime.fromisoformat(value[:-1] + '+00:00' if value.endswith('Z') else value)
+        except ValueError:
+            raise ValueError('must be an ISO 8601 timestamp')
+        return value
+
+class AnomalyRequest(BaseModel):
+    user_id: str
+    location_data: List[LocationPoint] = Field(min_length=2)
+
+class Area(BaseModel):
+    center: Coordinates
+    # Bounded: risk zone grids and the $centerSphere scan both grow with the radius
+    radius_km: float = Field(gt=0, le=config.MAX_PATTERN_RADIUS_KM)
+
+class TimeRange(BaseModel):
+    start: str
+    end: str
+
+class PatternRequest(BaseModel):
+    area: Area
+    time_range: Optional[TimeRange] = None
+    incident_types: Optional[List[str]] = None
+
+class ThreatRequest(BaseModel):
+    location: Coordinates
+    user_profile: Dict[str, Any] = {}
+    context: Dict[str, Any] = {}
+
+class BatchItem(BaseModel):
+    type: Literal['risk', 'anomaly', 'patterns', 'threat']
+    data: Dict[str, Any]
+
+class BatchRequest(BaseModel):
+    requests: List[BatchItem] = Field(min_length=1, max_length=config.MAX_BATCH_REQUESTS)
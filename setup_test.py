@@ -4,145 +4,273 @@ Setup and test script for Suraksha Yatra AI Service
 This script verifies MongoDB connection and tests AI endpoints
 """
 
+import functools
+import importlib
+import importlib.metadata
+import importlib.util
+import json
+import re
+import signal
+import subprocess
 import sys
 import os
+import time
 from datetime import datetime, timedelta
-import traceback
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import numpy as np
+import pytest
+from pymongo.errors import PyMongoError
+import config
 
-def test_mongodb_connection():
-    """Test MongoDB connection"""
+MODEL_MODULES = (
+    'ml_models.risk_predictor',
+    'ml_models.anomaly_detector',
+    'ml_models.pattern_analyzer'
+)
+
+# Local gunicorn server for the Flask app check
+SERVER_WORKERS = 4
+SERVER_STARTUP_TIMEOUT = 60  # seconds
+
+# Dependency check; a successful result is cached per environment and requirements.txt version
+REQUIRED_PACKAGES = [
+    'flask', 'pymongo', 'numpy', 'scipy', 
+    'python-dotenv', 'scikit-learn', 'pandas'
+]
+REQUIREMENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'requirements.txt')
+DEPENDENCY_CACHE_FILE = os.path.expanduser('~/.cache/suraksha_setup.json')
+
+TEST_ROUTE = {
+    'start': {'lat': 28.6139, 'lng': 77.2090},
+    'end': {'lat': 28.7041, 'lng': 77.1025}
+}
+
+@functools.lru_cache(maxsize=1)
+def get_db_client():
+    """One MongoDB client (and its buffers, caches and writer) for every check in the run"""
+    from database.mongodb_client import MongoDBClient
+    # Keep a warm pool for the checks, and fail fast when the server is unreachable
+    return MongoDBClient(
+        maxPoolSize=200,
+        minPoolSize=10,
+        maxIdleTimeMS=300_000,
+        serverSelectionTimeoutMS=2000
+    )
+
+@functools.lru_cache(maxsize=1)
+def ping_db():
+    """Ping MongoDB once per process (failures are not cached, so the next call retries)"""
+    get_db_client().client.admin.command('ping')
+    return True
+
+# Session fixtures: the client and models are built once per pytest process
+# (once per worker under pytest-xdist, e.g. `python -m pytest setup_test.py -n 3`)
+
+@pytest.fixture(scope="session")
+def db_client():
+    return get_db_client()
+
+@pytest.fixture(scope="session")
+def predictors(db_client):
+    # Load the model modules concurrently; much of a cold import is file reads
+    # and extension-module init, which overlap across threads
+    with ThreadPoolExecutor(max_workers=len(MODEL_MODULES)) as pool:
+        modules = list(pool.map(importlib.import_module, MODEL_MODULES))
+    
+    return (
+        modules[0].RiskPredictor(db_client),
+        modules[1].AnomalyDetector(db_client),
+        modules[2].PatternAnalyzer(db_client)
+    )
+
+def test_mongodb_connection(db_client):
+    """Test MongoDB connection (skipped when the server is unreachable)"""
     print("🔗 Testing MongoDB Connection...")
     
+    # Test connection by pinging the admin database
     try:
-        from database.mongodb_client import MongoDBClient
-        
-        # Initialize client
-        db_client = MongoDBClient()
-        
-        # Test connection by pinging the admin database
-        admin_db = db_client.client.admin
-        admin_db.command('ping')
-        
-        print("✅ MongoDB connection successful!")
-        
-        # Test database access
-        collections = db_client.db.list_collection_names()
-        print(f"✅ Connected to database: {db_client.db.name}")
-        print(f"✅ Available collections: {collections}")
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ MongoDB connection failed: {str(e)}")
-        print(f"Error details: {traceback.format_exc()}")
-        return False
+        ping_db()
+    except PyMongoError as e:
+        pytest.skip(f"MongoDB unreachable: {str(e)}")
+    
+    print("✅ MongoDB connection successful!")
+    
+    # Test database access
+    collections = db_client.db.list_collection_names()
+    print(f"✅ Connected to database: {db_client.db.name}")
+    print(f"✅ Available collections: {collections}")
 
-def test_ai_models():
+def test_ai_models(predictors):
     """Test AI model initialization"""
     print("\n🤖 Testing AI Models...")
     
+    risk_predictor, anomaly_detector, pattern_analyzer = predictors
+    print("✅ Risk Predictor, Anomaly Detector and Pattern Analyzer initialized")
+    
+    # Test simple prediction
+    risk_score = risk_predictor.predict_route_risk(TEST_ROUTE)
+    print(f"✅ Risk Prediction test: {risk_score}")
+    assert 0 <= risk_score <= 100
+
+def test_route_batch(predictors):
+    """Test the batched route prediction path the /api/risk/predict/batch endpoint uses"""
+    risk_predictor = predictors[0]
+    
+    # One shared point lookup for the whole batch; every copy must score like the single route
+    risk_scores = risk_predictor.predict_route_risk_batch([TEST_ROUTE] * 32)
+    print(f"✅ Batch Risk Prediction test: {len(risk_scores)} routes")
+    assert risk_scores == [risk_predictor.predict_route_risk(TEST_ROUTE)] * 32
+
+def test_incident_radius_consistency(predictors, db_client):
+    """
+    The in-memory incident index and the MongoDB path must agree on which incidents
+    fall inside the search radius, so a point's risk does not depend on which one served it
+    """
+    from scipy.spatial import cKDTree
+    from distance.haversine import EARTH_RADIUS_KM, hav_vec, to_unit_xyz
+    
+    risk_predictor = predictors[0]
+    center_lat, center_lng = TEST_ROUTE['start']['lat'], TEST_ROUTE['start']['lng']
+    radius_km = 1.0
+    
+    # Incidents just inside and just outside the radius on every bearing
+    bearings = np.radians(np.arange(0, 360, 15))
+    distances = np.concatenate([np.full(bearings.size, radius_km * 0.999), np.full(bearings.size, radius_km * 1.001)])
+    bearings = np.tile(bearings, 2)
+    angles = distances / EARTH_RADIUS_KM
+    lat0, lng0 = np.radians(center_lat), np.radians(center_lng)
+    lats = np.arcsin(np.sin(lat0) * np.cos(angles) + np.cos(lat0) * np.sin(angles) * np.cos(bearings))
+    lngs = lng0 + np.arctan2(np.sin(bearings) * np.sin(angles) * np.cos(lat0), np.cos(angles) - np.sin(lat0) * np.sin(lats))
+    lats, lngs = np.degrees(lats), np.degrees(lngs)
+    incidents = [{'location': {'coordinates': [lng, lat]}} for lat, lng in zip(lats, lngs)]
+    
+    # In-memory index (RiskPredictor._refresh_tree builds the same tree)
+    index = (cKDTree(to_unit_xyz(lats, lngs)), incidents)
+    tree_count = len(risk_predictor._query_tree(index, center_lat, center_lng, radius_km))
+    
+    # MongoDB path: the $centerSphere filter, and the client-side split of a batched query
+    max_angle = db_client._within_radius(center_lat, center_lng, radius_km)['$geoWithin']['$centerSphere'][1]
+    query_count = int((hav_vec(center_lat, center_lng, lats, lngs) / EARTH_RADIUS_KM <= max_angle).sum())
+    split_count = len(db_client._split_by_area(incidents, [(center_lat, center_lng)], radius_km)[0])
+    
+    print(f"✅ Incidents within {radius_km} km: tree {tree_count}, query {query_count}, split {split_count}")
+    assert tree_count == query_count == split_count == bearings.size // 2
+
+@pytest.fixture(scope="session")
+def server_url():
+    """
+    URL of a running AI service, started under gunicorn for the session if needed
+    Reuses a server already listening on the configured port (e.g. `python app.py`).
+    No --preload: each worker must build its own MongoDB client after forking
+    """
+    url = f"http://127.0.0.1:{config.AI_PORT}"
+    if _healthy(url):
+        yield url
+        return
+    
+    if importlib.util.find_spec('gunicorn') is None:
+        pytest.skip("gunicorn is not installed")
+    
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--workers', str(SERVER_WORKERS), '--bind', f"127.0.0.1:{config.AI_PORT}", 'app:app'
+    ], cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        deadline = time.monotonic() + SERVER_STARTUP_TIMEOUT
+        while not _healthy(url):
+            if server.poll() is not None:
+                pytest.fail(f"gunicorn exited with code {server.returncode}")
+            if time.monotonic() > deadline:
+                pytest.fail(f"AI service did not become healthy within {SERVER_STARTUP_TIMEOUT}s")
+            time.sleep(0.2)
+        yield url
+    finally:
+        # Quick shutdown: a graceful stop would wait out clients' idle keep-alive connections
+        server.send_signal(signal.SIGINT)
+        server.wait(timeout=30)
+
+def _healthy(url):
+    """True when the service at url answers its health check"""
     try:
-        from database.mongodb_client import MongoDBClient
-        from ml_models.risk_predictor import RiskPredictor
-        from ml_models.anomaly_detector import AnomalyDetector
-        from ml_models.pattern_analyzer import PatternAnalyzer
-        
-        db_client = MongoDBClient()
-        
-        # Test Risk Predictor
-        risk_predictor = RiskPredictor(db_client)
-        print("✅ Risk Predictor initialized")
-        
-        # Test simple prediction
-        test_route = {
-            'start': {'lat': 28.6139, 'lng': 77.2090},
-            'end': {'lat': 28.7041, 'lng': 77.1025}
-        }
-        
-        risk_score = risk_predictor.predict_route_risk(test_route)
-        print(f"✅ Risk Prediction test: {risk_score}")
-        
-        # Test Anomaly Detector
-        anomaly_detector = AnomalyDetector(db_client)
-        print("✅ Anomaly Detector initialized")
-        
-        # Test Pattern Analyzer
-        pattern_analyzer = PatternAnalyzer(db_client)
-        print("✅ Pattern Analyzer initialized")
-        
-        return True
-        
-    except Exception as e:
-        print(f"❌ AI model test failed: {str(e)}")
-        print(f"Error details: {traceback.format_exc()}")
+        return httpx.get(f"{url}/health", timeout=1).status_code == 200
+    except httpx.HTTPError:
         return False
 
-def test_flask_app():
+def test_flask_app(server_url):
     """Test Flask app startup"""
     print("\n🌐 Testing Flask App...")
     
+    # Test health endpoint on the running service
+    response = httpx.get(f"{server_url}/health", timeout=10)
+    assert response.status_code == 200, f"Health check failed: {response.status_code}"
+    print("✅ Flask app started successfully")
+    print(f"✅ Health check: {response.json()}")
+
+def _normalize_name(name):
+    """Normalize a distribution name (PEP 503) so e.g. Flask and flask match"""
+    return re.sub(r'[-_.]+', '-', name or '').lower()
+
+def check_dependencies():
+    """Print the status of each required package and return the missing ones"""
+    # Look packages up in the installed distribution metadata instead of importing
+    # them: far cheaper, and it matches on distribution names (scikit-learn,
+    # python-dotenv) rather than guessing their import names
+    installed = {_normalize_name(dist.metadata['Name']) for dist in importlib.metadata.distributions()}
+    
+    missing_packages = []
+    for package in REQUIRED_PACKAGES:
+        if _normalize_name(package) in installed:
+            print(f"✅ {package}")
+        else:
+            missing_packages.append(package)
+            print(f"❌ {package}")
+    return missing_packages
+
+def _dependency_stamp():
+    """Identifies the environment and requirements a dependency check ran against"""
+    return {'prefix': sys.prefix, 'mtime': os.stat(REQUIREMENTS_FILE).st_mtime, 'ok': True}
+
+def _dependencies_verified():
+    """True when the last successful check ran in this environment against the current requirements"""
     try:
-        # Import and create app
-        from app import app
-        
-        with app.test_client() as client:
-            # Test health endpoint
-            response = client.get('/health')
-            
-            if response.status_code == 200:
-                print("✅ Flask app started successfully")
-                print(f"✅ Health check: {response.json}")
-                return True
-            else:
-                print(f"❌ Health check failed: {response.status_code}")
-                return False
-                
-    except Exception as e:
-        print(f"❌ Flask app test failed: {str(e)}")
-        print(f"Error details: {traceback.format_exc()}")
+        with open(DEPENDENCY_CACHE_FILE) as f:
+            return json.load(f) == _dependency_stamp()
+    except (OSError, ValueError):
         return False
 
+def _record_dependencies_verified():
+    """Remember a successful check; the cache is best effort"""
+    try:
+        os.makedirs(os.path.dirname(DEPENDENCY_CACHE_FILE), exist_ok=True)
+        with open(DEPENDENCY_CACHE_FILE, 'w') as f:
+            json.dump(_dependency_stamp(), f)
+    except OSError:
+        pass
+
 def main():
     """Main setup and test function"""
     print("🚀 Suraksha Yatra AI Service Setup & Test")
     print("=" * 50)
     
-    # Check Python dependencies
+    # Check Python dependencies (skipped when nothing changed since the last success)
     print("📦 Checking dependencies...")
-    required_packages = [
-        'flask', 'pymongo', 'numpy', 'scipy', 
-        'geopy', 'python-dotenv', 'scikit-learn', 'pandas'
-    ]
-    
-    missing_packages = []
-    for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
-            print(f"✅ {package}")
-        except ImportError:
-            missing_packages.append(package)
-            print(f"❌ {package}")
-    
-    if missing_packages:
-        print(f"\n❌ Missing packages: {missing_packages}")
-        print("Please run: pip install -r requirements.txt")
-        return False
+    if _dependencies_verified():
+        print("✅ Unchanged since the last successful check")
+    else:
+        missing_packages = check_dependencies()
+        if missing_packages:
+            print(f"\n❌ Missing packages: {missing_packages}")
+            print("Please run: pip install -r requirements.txt")
+            return False
+        _record_dependencies_verified()
     
     print("\n✅ All dependencies satisfied!")
     
-    # Test MongoDB connection
-    if not test_mongodb_connection():
-        print("\n❌ Setup failed at MongoDB connection")
-        return False
-    
-    # Test AI models
-    if not test_ai_models():
-        print("\n❌ Setup failed at AI model initialization")
-        return False
-    
-    # Test Flask app
-    if not test_flask_app():
-        print("\n❌ Setup failed at Flask app test")
+    # MongoDB connection, AI models and Flask app checks, run through pytest so
+    # the fixtures are shared (-s keeps their progress output, -rs lists skips)
+    if pytest.main(["-q", "-s", "-rs", __file__]) != pytest.ExitCode.OK:
+        print("\n❌ Setup checks failed")
         return False
     
     print("\n🎉 All tests passed! AI Service is ready to run.")
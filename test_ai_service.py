@@ -1,162 +1,339 @@
-import requests
-import json
+import asyncio
+import atexit
+import hashlib
+import httpx
+import orjson
+import shelve
+import socket
+import sys
+import time
+from urllib.parse import urlsplit
 from datetime import datetime, timedelta
 
 # AI Service URL
 AI_SERVICE_URL = "http://localhost:5000"
 
-def test_risk_prediction():
-    """Test route risk prediction"""
-    print("Testing Risk Prediction...")
-    
-    payload = {
-        "route": {
-            "start": {"lat": 28.6139, "lng": 77.2090},  # New Delhi
-            "end": {"lat": 28.7041, "lng": 77.1025}      # Delhi Airport
+# Script runs reuse successful responses for identical payloads for a few
+# minutes (pass --force to always hit the service). pytest runs never cache
+CACHE_PATH = ".test_ai_service_cache"
+CACHE_TTL = 300  # seconds
+_cache = None
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+# The checks below are coroutines so the script can run them concurrently;
+# each one prints its whole report at once so concurrent output stays readable
+
+RISK_PAYLOAD = {
+    "route": {
+        "start": {"lat": 28.6139, "lng": 77.2090},  # New Delhi
+        "end": {"lat": 28.7041, "lng": 77.1025}      # Delhi Airport
+    },
+    "time_of_day": "evening",
+    "user_id": "test_user_123"
+}
+
+# Sample location data with potential anomaly (high speed)
+ANOMALY_PAYLOAD = {
+    "user_id": "test_user_123",
+    "location_data": [
+        {
+            "lat": 28.6139,
+            "lng": 77.2090,
+            "timestamp": "2023-01-01T10:00:00Z",
+            "speed": 25.5
+        },
+        {
+            "lat": 28.6200,
+            "lng": 77.2150,
+            "timestamp": "2023-01-01T10:01:00Z",
+            "speed": 150.0  # Potentially anomalous speed
         },
-        "time_of_day": "evening",
-        "user_id": "test_user_123"
+        {
+            "lat": 28.6300,
+            "lng": 77.2200,
+            "timestamp": "2023-01-01T10:02:00Z",
+            "speed": 30.0
+        }
+    ]
+}
+
+THREAT_PAYLOAD = {
+    "location": {"lat": 28.6139, "lng": 77.2090},
+    "user_profile": {
+        "age_group": "adult",
+        "gender": "female",
+        "travel_mode": "walking"
+    },
+    "context": {
+        "time_of_day": "night",
+        "day_of_week": "saturday",
+        "weather": "clear"
     }
+}
+
+def pattern_payload():
+    """Pattern analysis payload for the last 30 days (to the minute, so reruns can hit the cache)"""
+    now = datetime.now().replace(second=0, microsecond=0)
+    return {
+        "area": {
+            "center": {"lat": 28.6139, "lng": 77.2090},
+            "radius_km": 5.0
+        },
+        "time_range": {
+            "start": (now - timedelta(days=30)).isoformat(),
+            "end": now.isoformat()
+        },
+        "incident_types": ["crime", "accident"]
+    }
+
+async def post_json(client, url, payload):
+    """
+    POST a payload and return (status, result), where result is the decoded body
+    on 200 and the raw text otherwise. Successful results are cached by payload
+    when the script runs with the cache open
+    """
+    key = hashlib.blake2b(orjson.dumps([url, payload], option=orjson.OPT_SORT_KEYS)).hexdigest()
+    if _cache is not None:
+        entry = _cache.get(key)
+        if entry and time.time() - entry[0] < CACHE_TTL:
+            return 200, entry[1]
+    
+    # orjson encodes to and decodes from bytes directly, skipping the str round trip
+    response = await client.post(url, content=orjson.dumps(payload), headers=JSON_HEADERS)
+    if response.status_code != 200:
+        return response.status_code, response.text
+    
+    result = orjson.loads(response.content)
+    if _cache is not None:
+        _cache[key] = (time.time(), result)
+    return 200, result
+
+# Report lines for each endpoint's result, shared by the single and batch checks
+
+def describe_risk(result):
+    return [
+        f"✅ Risk Score: {result['risk_score']}",
+        f"✅ Risk Level: {result['risk_level']}",
+        f"✅ Recommendations: {result['recommendations']}"
+    ]
+
+def describe_anomaly(result):
+    return [
+        f"✅ Is Anomaly: {result['is_anomaly']}",
+        f"✅ Confidence: {result['confidence_score']}",
+        f"✅ Type: {result.get('anomaly_type', 'None')}",
+        f"✅ Details: {result.get('details', 'None')}"
+    ]
+
+def describe_patterns(result):
+    return [
+        f"✅ Hotspots Found: {len(result['hotspots'])}",
+        f"✅ Trends: {orjson.dumps(result['trends'], option=orjson.OPT_INDENT_2).decode()}",
+        f"✅ Risk Zones: {len(result['risk_zones'])}",
+        f"✅ Insights: {len(result['insights'])}"
+    ]
+
+def describe_threat(result):
+    return [
+        f"✅ Threat Level: {result['threat_level']}",
+        f"✅ Threat Score: {result['threat_score']}",
+        f"✅ Contributing Factors: {result['contributing_factors']}",
+        f"✅ Recommendations: {result['recommendations']}"
+    ]
+
+async def check_risk_prediction(client):
+    """Test route risk prediction"""
+    report = ["\nTesting Risk Prediction..."]
     
     try:
-        response = requests.post(f"{AI_SERVICE_URL}/api/risk/predict", json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Risk Score: {result['risk_score']}")
-            print(f"✅ Risk Level: {result['risk_level']}")
-            print(f"✅ Recommendations: {result['recommendations']}")
+        status, result = await post_json(client, "/api/risk/predict", RISK_PAYLOAD)
+        if status == 200:
+            report += describe_risk(result)
         else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
+            report.append(f"❌ Error: {status} - {result}")
     except Exception as e:
-        print(f"❌ Connection Error: {e}")
+        report.append(f"❌ Connection Error: {e}")
+    
+    print("\n".join(report))
 
-def test_anomaly_detection():
+async def check_anomaly_detection(client):
     """Test anomaly detection"""
-    print("\nTesting Anomaly Detection...")
-    
-    # Create sample location data with potential anomaly (high speed)
-    payload = {
-        "user_id": "test_user_123",
-        "location_data": [
-            {
-                "lat": 28.6139,
-                "lng": 77.2090,
-                "timestamp": "2023-01-01T10:00:00Z",
-                "speed": 25.5
-            },
-            {
-                "lat": 28.6200,
-                "lng": 77.2150,
-                "timestamp": "2023-01-01T10:01:00Z",
-                "speed": 150.0  # Potentially anomalous speed
-            },
-            {
-                "lat": 28.6300,
-                "lng": 77.2200,
-                "timestamp": "2023-01-01T10:02:00Z",
-                "speed": 30.0
-            }
-        ]
-    }
+    report = ["\nTesting Anomaly Detection..."]
     
     try:
-        response = requests.post(f"{AI_SERVICE_URL}/api/anomaly/detect", json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Is Anomaly: {result['is_anomaly']}")
-            print(f"✅ Confidence: {result['confidence_score']}")
-            print(f"✅ Type: {result.get('anomaly_type', 'None')}")
-            print(f"✅ Details: {result.get('details', 'None')}")
+        status, result = await post_json(client, "/api/anomaly/detect", ANOMALY_PAYLOAD)
+        if status == 200:
+            report += describe_anomaly(result)
         else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
+            report.append(f"❌ Error: {status} - {result}")
     except Exception as e:
-        print(f"❌ Connection Error: {e}")
+        report.append(f"❌ Connection Error: {e}")
+    
+    print("\n".join(report))
 
-def test_pattern_analysis():
+async def check_pattern_analysis(client):
     """Test pattern analysis"""
-    print("\nTesting Pattern Analysis...")
-    
-    payload = {
-        "area": {
-            "center": {"lat": 28.6139, "lng": 77.2090},
-            "radius_km": 5.0
-        },
-        "time_range": {
-            "start": (datetime.now() - timedelta(days=30)).isoformat(),
-            "end": datetime.now().isoformat()
-        },
-        "incident_types": ["crime", "accident"]
-    }
+    report = ["\nTesting Pattern Analysis..."]
     
     try:
-        response = requests.post(f"{AI_SERVICE_URL}/api/patterns/analyze", json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Hotspots Found: {len(result['hotspots'])}")
-            print(f"✅ Trends: {json.dumps(result['trends'], indent=2)}")
-            print(f"✅ Risk Zones: {len(result['risk_zones'])}")
-            print(f"✅ Insights: {len(result['insights'])}")
+        status, result = await post_json(client, "/api/patterns/analyze", pattern_payload())
+        if status == 200:
+            report += describe_patterns(result)
         else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
+            report.append(f"❌ Error: {status} - {result}")
     except Exception as e:
-        print(f"❌ Connection Error: {e}")
+        report.append(f"❌ Connection Error: {e}")
+    
+    print("\n".join(report))
 
-def test_threat_assessment():
+async def check_threat_assessment(client):
     """Test threat assessment"""
-    print("\nTesting Threat Assessment...")
-    
-    payload = {
-        "location": {"lat": 28.6139, "lng": 77.2090},
-        "user_profile": {
-            "age_group": "adult",
-            "gender": "female",
-            "travel_mode": "walking"
-        },
-        "context": {
-            "time_of_day": "night",
-            "day_of_week": "saturday",
-            "weather": "clear"
-        }
-    }
+    report = ["\nTesting Threat Assessment..."]
     
     try:
-        response = requests.post(f"{AI_SERVICE_URL}/api/threat/assess", json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Threat Level: {result['threat_level']}")
-            print(f"✅ Threat Score: {result['threat_score']}")
-            print(f"✅ Contributing Factors: {result['contributing_factors']}")
-            print(f"✅ Recommendations: {result['recommendations']}")
+        status, result = await post_json(client, "/api/threat/assess", THREAT_PAYLOAD)
+        if status == 200:
+            report += describe_threat(result)
         else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
+            report.append(f"❌ Error: {status} - {result}")
     except Exception as e:
-        print(f"❌ Connection Error: {e}")
+        report.append(f"❌ Connection Error: {e}")
+    
+    print("\n".join(report))
 
-def test_health_check():
+async def check_health_check(client):
     """Test health check"""
-    print("\nTesting Health Check...")
+    report = ["\nTesting Health Check..."]
     
     try:
-        response = requests.get(f"{AI_SERVICE_URL}/health")
+        response = await client.get("/health")
         if response.status_code == 200:
-            result = response.json()
-            print(f"✅ Service Status: {result['status']}")
-            print(f"✅ Service: {result['service']}")
-            print(f"✅ Timestamp: {result['timestamp']}")
+            result = orjson.loads(response.content)
+            report.append(f"✅ Service Status: {result['status']}")
+            report.append(f"✅ Service: {result['service']}")
+            report.append(f"✅ Timestamp: {result['timestamp']}")
         else:
-            print(f"❌ Error: {response.status_code} - {response.text}")
+            report.append(f"❌ Error: {response.status_code} - {response.text}")
+    except Exception as e:
+        report.append(f"❌ Connection Error: {e}")
+    
+    print("\n".join(report))
+
+async def post_batch(client, items):
+    """
+    Send several (type, data) requests to /api/batch in one POST
+    Returns the per-request results in the same order as items
+    """
+    payload = {"requests": [{"type": kind, "data": data} for kind, data in items]}
+    status, result = await post_json(client, "/api/batch", payload)
+    if status != 200:
+        raise RuntimeError(f"{status} - {result}")
+    return result["responses"]
+
+async def check_batch(client):
+    """Test all model endpoints through a single batch request"""
+    report = ["\nTesting Batch Endpoint..."]
+    
+    checks = (
+        ("Risk Prediction", "risk", RISK_PAYLOAD, describe_risk),
+        ("Anomaly Detection", "anomaly", ANOMALY_PAYLOAD, describe_anomaly),
+        ("Pattern Analysis", "patterns", pattern_payload(), describe_patterns),
+        ("Threat Assessment", "threat", THREAT_PAYLOAD, describe_threat)
+    )
+    
+    try:
+        results = await post_batch(client, [(kind, data) for _, kind, data, _ in checks])
+        for (title, _, _, describe), result in zip(checks, results):
+            report.append(f"{title}:")
+            if result["status"] == 200:
+                report += describe(result)
+            else:
+                report.append(f"❌ Error: {result['status']} - {result.get('error')}")
+    except RuntimeError as e:
+        report.append(f"❌ Error: {e}")
     except Exception as e:
-        print(f"❌ Connection Error: {e}")
+        report.append(f"❌ Connection Error: {e}")
+    
+    print("\n".join(report))
+
+ALL_CHECKS = (
+    check_health_check,
+    check_risk_prediction,
+    check_anomaly_detection,
+    check_pattern_analysis,
+    check_threat_assessment,
+    check_batch
+)
+
+# One event loop and one keep-alive client for the whole process, so pytest's
+# separate test calls reuse the pooled connections instead of reconnecting
+_loop = asyncio.new_event_loop()
+_client = None
+
+async def _gather(checks):
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=AI_SERVICE_URL,
+            timeout=10,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+        )
+    await asyncio.gather(*(check(_client) for check in checks))
+
+@atexit.register
+def _close():
+    if _client is not None:
+        _loop.run_until_complete(_client.aclose())
+    _loop.close()
+
+def _up():
+    """Cheap TCP probe: is anything listening at AI_SERVICE_URL?"""
+    url = urlsplit(AI_SERVICE_URL)
+    try:
+        with socket.create_connection((url.hostname, url.port or 80), timeout=0.1):
+            return True
+    except OSError:
+        return False
+
+def run_checks(*checks):
+    """Run endpoint checks concurrently over the shared client (skipped when the service is down)"""
+    if not _up():
+        print(f"\n❌ AI service is not reachable at {AI_SERVICE_URL} - start it with: python app.py")
+        return
+    _loop.run_until_complete(_gather(checks))
+
+# pytest entry points
+def test_risk_prediction():
+    run_checks(check_risk_prediction)
+
+def test_anomaly_detection():
+    run_checks(check_anomaly_detection)
+
+def test_pattern_analysis():
+    run_checks(check_pattern_analysis)
+
+def test_threat_assessment():
+    run_checks(check_threat_assessment)
+
+def test_health_check():
+    run_checks(check_health_check)
+
+def test_batch():
+    run_checks(check_batch)
 
 if __name__ == "__main__":
     print("🧪 Testing AI Service Endpoints\n")
     
-    # Test all endpoints
-    test_health_check()
-    test_risk_prediction()
-    test_anomaly_detection()
-    test_pattern_analysis()
-    test_threat_assessment()
+    if "--force" not in sys.argv:
+        _cache = shelve.open(CACHE_PATH)
+    
+    # Test all endpoints concurrently
+    try:
+        run_checks(*ALL_CHECKS)
+    finally:
+        if _cache is not None:
+            _cache.close()
     
     print("\n🏁 Testing Complete!")
     print("\nTo start the AI service:")